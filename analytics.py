@@ -0,0 +1,147 @@
+# Сводка занятости кортов для /api/stats: число записей по (месяц, корт, день недели, слот).
+# Сводка обновляется в той же транзакции, что запись и отмена, поэтому отчет читает только ее
+# и не делает GROUP BY по bookings с архивом. Пересчет по уже существующим записям:
+# python analytics.py /data/tennis_booking.db
+import argparse
+import calendar
+import json
+import logging
+from datetime import MAXYEAR, MINYEAR, date
+
+import database
+import schedule
+
+MAX_STATS_MONTHS = 24
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+def stats_key(day, court_id, slot):
+    value = date.fromordinal(day + schedule.EPOCH_ORDINAL)
+    return value.year * 100 + value.month, court_id, value.weekday(), slot
+
+def record_bookings(cursor, items):
+    # items: (day, court_id, slot, записей, отмен); вызывается внутри транзакции записи
+    cursor.executemany('''
+        INSERT INTO booking_stats (month, court_id, weekday, slot, bookings, cancellations)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (month, court_id, weekday, slot) DO UPDATE SET
+            bookings = bookings + excluded.bookings,
+            cancellations = cancellations + excluded.cancellations
+    ''', [(*stats_key(day, court_id, slot), booked, cancelled) for day, court_id, slot, booked, cancelled in items])
+
+def fetch_stats(conn, month_from, month_to):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT month, court_id, weekday, slot, bookings, cancellations
+        FROM booking_stats
+        WHERE month BETWEEN ? AND ?
+    ''', (month_from, month_to))
+    return cursor.fetchall()
+
+def backfill(conn):
+    # Пересчитывает число записей по bookings и архиву; счетчик отмен восстановить не из чего, он сохраняется.
+    # Под блокировкой записи, чтобы параллельные записи не потерялись между пересчетом и заменой
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('UPDATE booking_stats SET bookings = 0')
+    cursor.execute('''
+        INSERT INTO booking_stats (month, court_id, weekday, slot, bookings)
+        SELECT CAST(strftime('%Y%m', day * 86400, 'unixepoch') AS INTEGER),
+               court_id,
+               (CAST(strftime('%w', day * 86400, 'unixepoch') AS INTEGER) + 6) % 7,
+               slot,
+               COUNT(*)
+        FROM (
+            SELECT day, court_id, slot FROM bookings
+            UNION ALL
+            SELECT day, court_id, slot FROM bookings_archive
+        )
+        WHERE true
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (month, court_id, weekday, slot) DO UPDATE SET bookings = excluded.bookings
+    ''')
+    cursor.execute('DELETE FROM booking_stats WHERE bookings = 0 AND cancellations = 0')
+    total, rows = cursor.execute('SELECT COALESCE(SUM(bookings), 0), COUNT(*) FROM booking_stats').fetchone()
+    conn.commit()
+    return {'bookings': total, 'rows': rows}
+
+def month_number(value):
+    # "YYYY-MM" -> YYYYMM; ValueError для несуществующего месяца или года вне диапазона datetime.date
+    year, month = (int(part) for part in value.split('-'))
+    if not 1 <= month <= 12 or not MINYEAR <= year <= MAXYEAR:
+        raise ValueError(value)
+    return year * 100 + month
+
+def month_days(month):
+    # Без даты следующего месяца: для 9999-12 ее уже нет
+    start = date(month // 100, month % 100, 1).toordinal() - schedule.EPOCH_ORDINAL
+    return range(start, start + calendar.monthrange(month // 100, month % 100)[1])
+
+def months_between(month_from, month_to):
+    months = []
+    month = month_from
+    while month <= month_to:
+        months.append(month)
+        month = month + 89 if month % 100 == 12 else month + 1
+    return months
+
+def utilization(bookings, capacity):
+    return round(bookings / capacity, 4) if capacity else 0.0
+
+def build_report(rows, catalog, months):
+    # Емкость считается по каталогу: каждый открытый день дает по одному месту на каждый слот корта
+    report = {}
+    counts = {}
+    for month, court_id, weekday, slot, bookings, cancellations in rows:
+        key = (court_id, weekday, slot)
+        booked, cancelled = counts.get(key, (0, 0))
+        counts[key] = (booked + bookings, cancelled + cancellations)
+
+    for court in catalog.courts:
+        open_days = [0] * 7
+        for month in months:
+            for day in month_days(month):
+                if day not in court.blackout:
+                    open_days[(day + schedule.EPOCH_ORDINAL - 1) % 7] += 1
+
+        grid = [[counts.get((court.id, weekday, slot), (0, 0))[0] for slot in court.starts] for weekday in range(7)]
+        cancellations = sum(
+            cancelled for (court_id, _, slot), (_, cancelled) in counts.items()
+            if court_id == court.id and slot in court.positions
+        )
+        bookings = sum(map(sum, grid))
+        capacity = sum(open_days) * len(court.starts)
+        report[court.code] = {
+            "bookings": bookings,
+            "cancellations": cancellations,
+            "capacity": capacity,
+            "utilization": utilization(bookings, capacity),
+            "by_weekday": {
+                WEEKDAYS[weekday]: utilization(sum(grid[weekday]), open_days[weekday] * len(court.starts))
+                for weekday in range(7)
+            },
+            "by_time_slot": {
+                time_slot: utilization(sum(grid[weekday][i] for weekday in range(7)), sum(open_days))
+                for i, time_slot in enumerate(court.time_slots)
+            },
+            # grid[день недели][слот]: доля занятых мест, дни недели с понедельника, слоты как в time_slots
+            "grid": [
+                [utilization(count, open_days[weekday]) for count in grid[weekday]]
+                for weekday in range(7)
+            ]
+        }
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Пересчет сводки занятости по существующим записям')
+    parser.add_argument('db_path', nargs='?', default=None, help='путь к базе (по умолчанию DB_PATH)')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    # Схема (и таблица сводки) создается так же, как при старте приложения
+    db = database.Database(db_path=args.db_path)
+    db.initialize()
+    conn = db.get_connection()
+    print(json.dumps(backfill(conn)))
+    conn.close()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+
+import events
+import schedule
+
+logger = logging.getLogger(__name__)
+
+# Прошедшие записи старше ARCHIVE_KEEP_DAYS переносятся в bookings_archive небольшими порциями
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_KEEP_DAYS = int(os.getenv('ARCHIVE_KEEP_DAYS', '7'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+# Пауза между порциями, чтобы запись на корты не ждала архиватор
+ARCHIVE_PAUSE = 0.05
+VACUUM_PAGES = 1000
+ANALYSIS_LIMIT = 1000
+
+def archive_batch(conn, before_day, batch_size):
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+
+    rows = cursor.execute(
+        'SELECT day, court_id, slot, id, user_id, created_at FROM bookings WHERE day < ? LIMIT ?',
+        (before_day, batch_size)
+    ).fetchall()
+    if not rows:
+        conn.rollback()
+        return 0
+
+    cursor.executemany(
+        'INSERT OR IGNORE INTO bookings_archive (day, court_id, slot, id, user_id, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [tuple(row) for row in rows]
+    )
+    cursor.executemany(
+        'DELETE FROM bookings WHERE day = ? AND court_id = ? AND slot = ?',
+        [(row['day'], row['court_id'], row['slot']) for row in rows]
+    )
+    # Другим воркерам - один сброс кэша на проход, в его последней порции (как bookings_archived у себя)
+    if cursor.execute('SELECT 1 FROM bookings WHERE day < ? LIMIT 1', (before_day,)).fetchone() is None:
+        events.write_outbox(cursor, [{"reset": True}])
+    conn.commit()
+    return len(rows)
+
+def purge_waitlist(conn, before_day):
+    # Очередь на прошедшие дни уже не нужна
+    conn.execute('DELETE FROM waitlist WHERE day < ?', (before_day,))
+    conn.commit()
+
+def maintain(conn):
+    # Статистика для планировщика и возврат освободившихся страниц без полного VACUUM
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    conn.execute('ANALYZE')
+    conn.commit()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+
+async def archive_old_bookings(db, on_archived=None, keep_days=ARCHIVE_KEEP_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    before_day = schedule.today_number() - keep_days
+    total = 0
+    while True:
+        archived = await db.run(archive_batch, before_day, batch_size)
+        total += archived
+        if archived < batch_size:
+            break
+        await asyncio.sleep(ARCHIVE_PAUSE)
+    # Одно уведомление на весь проход, а не на каждую перенесенную запись
+    if on_archived and total:
+        await on_archived(total)
+
+    await db.run(purge_waitlist, schedule.today_number())
+    await db.run(maintain)
+    if total:
+        logger.info("Archived %s bookings older than %s", total, schedule.day_string(before_day))
+    return total
+
+async def run_archiver(db, on_archived=None, interval=ARCHIVE_INTERVAL):
+    while True:
+        try:
+            await archive_old_bookings(db, on_archived)
+        except Exception:
+            logger.exception("Booking archival failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import os
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+CONTENT_TYPES = {
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'application/javascript; charset=utf-8',
+}
+# Версионированные файлы не меняются, страницу клиент перепроверяет по ETag
+VERSIONED_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PAGE_CACHE_CONTROL = 'no-cache'
+VERSIONED_FILES = ['app.css', 'app.js']
+
+def minify(text):
+    # Убираем отступы, пустые строки и строки-комментарии; переводы строк оставляем для JS
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+def accepted_encodings(header):
+    encodings = set()
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        key, _, value = params.partition('=')
+        if key.strip() == 'q':
+            try:
+                if float(value) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+class Asset:
+    def __init__(self, body, content_type, cache_control):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        self.bodies = {'identity': body}
+
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            self.bodies['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.bodies['br'] = compressed
+
+        self.etags = {encoding: f'"{self.version}-{encoding}"' for encoding in self.bodies}
+
+class AssetStore:
+    # Страница веб-приложения: минифицируется и сжимается один раз при старте
+    def __init__(self, static_dir=STATIC_DIR):
+        self.static_dir = static_dir
+        self._assets = {}
+
+    def read(self, name):
+        with open(os.path.join(self.static_dir, name), encoding='utf-8') as f:
+            return f.read()
+
+    def build(self):
+        assets = {}
+        page = self.read('index.html')
+
+        for name in VERSIONED_FILES:
+            stem, ext = os.path.splitext(name)
+            asset = Asset(minify(self.read(name)).encode(), CONTENT_TYPES[ext], VERSIONED_CACHE_CONTROL)
+            versioned_name = f'{stem}.{asset.version}{ext}'
+            assets[versioned_name] = asset
+            page = page.replace('{{' + name + '}}', f'/static/{versioned_name}')
+
+        assets['index.html'] = Asset(minify(page).encode(), CONTENT_TYPES['.html'], PAGE_CACHE_CONTROL)
+        self._assets = assets
+
+    def respond(self, request, name):
+        if not self._assets:
+            self.build()
+
+        asset = self._assets.get(name)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Файл не найден")
+
+        accepted = accepted_encodings(request.headers.get('accept-encoding', ''))
+        encoding = next((e for e in ('br', 'gzip') if e in accepted and e in asset.bodies), 'identity')
+        headers = {
+            'ETag': asset.etags[encoding],
+            'Cache-Control': asset.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or tags & set(asset.etags.values()):
+                return Response(status_code=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(content=asset.bodies[encoding], media_type=asset.content_type, headers=headers)
+
+store = AssetStore()
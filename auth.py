@@ -0,0 +1,118 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+# Токен бота нужен для проверки подписи initData. Без него все запросы пользователей получают 401.
+# Для локального запуска вне Telegram подпись можно отключить явно: AUTH_INSECURE=1 -
+# тогда пользователь берется из initData как есть
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+AUTH_INSECURE = os.getenv('AUTH_INSECURE') == '1'
+# Сколько initData считается действительным после auth_date
+INIT_DATA_MAX_AGE = int(os.getenv('INIT_DATA_MAX_AGE', '86400'))
+SESSION_TTL = float(os.getenv('SESSION_TTL', '600'))
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '10000'))
+# Токен для админских эндпоинтов (выгрузка, импорт); без него они недоступны
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def secret_key(bot_token):
+    return hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+
+def data_check_string(fields):
+    return '\n'.join(f"{name}={fields[name]}" for name in sorted(fields))
+
+def verify_init_data(init_data, key, max_age=INIT_DATA_MAX_AGE, now=None):
+    # Проверка по документации Telegram WebApp: HMAC-SHA256 от отсортированных полей без hash.
+    # Возвращает (user, auth_date), при ошибке - ValueError
+    fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    received = fields.pop('hash', None)
+    if key is not None:
+        if not received:
+            raise ValueError("initData has no hash")
+        expected = hmac.new(key, data_check_string(fields).encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, received):
+            raise ValueError("initData signature mismatch")
+
+    auth_date = int(fields.get('auth_date', 0))
+    if key is not None and (now or time.time()) - auth_date > max_age:
+        raise ValueError("initData expired")
+
+    user = json.loads(fields.get('user', 'null'))
+    if not isinstance(user, dict) or not isinstance(user.get('id'), int):
+        raise ValueError("initData has no user")
+    return user, auth_date
+
+class SessionCache:
+    # LRU проверенных initData: повторные запросы с той же строкой не пересчитывают HMAC.
+    # Запись живет SESSION_TTL, но не дольше срока действия самого initData
+    def __init__(self, bot_token, ttl=SESSION_TTL, max_size=SESSION_CACHE_SIZE, max_age=INIT_DATA_MAX_AGE,
+                 insecure=AUTH_INSECURE):
+        self.key = secret_key(bot_token) if bot_token else None
+        # Без ключа initData без подписи принимается, только если это разрешено явно
+        self.insecure = insecure
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def verify(self, init_data):
+        now = time.time()
+        item = self._items.get(init_data)
+        if item is not None and item[1] > now:
+            self._items.move_to_end(init_data)
+            self.hits += 1
+            return item[0]
+
+        self.misses += 1
+        if self.key is None and not self.insecure:
+            raise ValueError("BOT_TOKEN is not set")
+        user, auth_date = verify_init_data(init_data, self.key, self.max_age, now)
+        expires = now + self.ttl
+        if self.key is not None:
+            expires = min(expires, auth_date + self.max_age)
+        self._items[init_data] = (user, expires)
+        self._items.move_to_end(init_data)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return user
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._items),
+            "max_size": self.max_size
+        }
+
+sessions = SessionCache(BOT_TOKEN)
+if sessions.key is None and sessions.insecure:
+    logger.warning("BOT_TOKEN is not set and AUTH_INSECURE=1 - Telegram initData signatures are not checked")
+elif sessions.key is None:
+    logger.error("BOT_TOKEN is not set - all user requests are rejected (set AUTH_INSECURE=1 for local runs)")
+
+async def current_user(request: Request):
+    # Зависимость FastAPI: клиент передает initData в заголовке "Authorization: tma <initData>"
+    scheme, _, init_data = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'tma' or not init_data:
+        raise HTTPException(status_code=401, detail="Требуется авторизация через Telegram")
+    try:
+        return sessions.verify(init_data)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Недействительные данные авторизации")
+
+async def require_admin(request: Request):
+    # Админские скрипты передают "Authorization: Bearer <ADMIN_TOKEN>"
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if not ADMIN_TOKEN or scheme.lower() != 'bearer' or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Нет доступа")
@@ -0,0 +1,329 @@
+# Нагрузочный бенчмарк API: наполняет отдельную SQLite базу и гоняет запросы через ASGI в процессе.
+# Пример: python bench.py --users 5000 --days 120 --requests 2000 --concurrency 50 --output bench.json
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import auth
+import database
+import main
+import ratelimit
+import schedule
+import storage
+
+# Бенчмарк подписывает initData своим токеном, чтобы проверка подписи и кэш сессий работали как в проде
+BENCH_BOT_TOKEN = 'bench'
+
+class CountingDatabase(database.Database):
+    # Считает все SQL-запросы, выполненные на соединениях пула
+    def __init__(self, *args, **kwargs):
+        self.query_count = 0
+        self._count_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _count(self, statement):
+        with self._count_lock:
+            self.query_count += 1
+
+    def get_connection(self):
+        conn = super().get_connection()
+        conn.set_trace_callback(self._count)
+        return conn
+
+def seed(db_path, users, days_back, days_ahead, fill, rng):
+    conn = sqlite3.connect(db_path)
+    today = schedule.today_number()
+    days = list(range(today - days_back, today + days_ahead))
+    slots = [(court.id, slot) for court in schedule.catalog().courts for slot in court.starts]
+
+    conn.executemany(
+        'INSERT INTO users (user_id, first_name) VALUES (?, ?)',
+        ((user_id, f'User {user_id}') for user_id in range(1, users + 1))
+    )
+
+    rows = []
+    for day in days:
+        taken = rng.sample(slots, int(len(slots) * fill))
+        players = rng.sample(range(1, users + 1), min(len(taken), users))
+        for (court_id, slot), user_id in zip(taken, players):
+            rows.append((len(rows) + 1, user_id, court_id, day, slot))
+    conn.executemany(
+        'INSERT INTO bookings (id, user_id, court_id, day, slot) VALUES (?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.execute("UPDATE sequences SET value = ? WHERE name = 'bookings'", (len(rows),))
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return days, len(rows)
+
+def init_data(user_id, key):
+    fields = {
+        'auth_date': str(int(time.time())),
+        'user': json.dumps({'id': user_id, 'first_name': f'User {user_id}'}),
+    }
+    fields['hash'] = hmac.new(key, auth.data_check_string(fields).encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+async def asgi_request(app, method, path, params=None, body=None, init_data=None):
+    # Минимальный ASGI-клиент, чтобы не тянуть лишних зависимостей
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(params or {}).encode(),
+        'root_path': '',
+        'headers': [(b'host', b'bench'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(payload)).encode())]
+                   + ([(b'authorization', f'tma {init_data}'.encode())] if init_data else []),
+        'client': ('127.0.0.1', 0),
+        'server': ('bench', 80),
+    }
+    sent = False
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await asyncio.sleep(3600)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    body = b''.join(chunks)
+    return status, json.loads(body) if body else None
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+async def run_phase(app, db, name, calls, concurrency, sessions):
+    latencies = []
+    statuses = {}
+    results = []
+    queue = list(reversed(calls))
+    queries_before = db.query_count
+
+    async def worker():
+        while queue:
+            method, path, params, body, user_id = queue.pop()
+            started = time.perf_counter()
+            status, data = await asgi_request(app, method, path, params, body, sessions.get(user_id))
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            results.append((status, data, user_id, body))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    count = len(latencies)
+
+    report = {
+        'requests': count,
+        'statuses': statuses,
+        'throughput_rps': round(count / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(max(latencies), 3),
+        } if latencies else None,
+        'queries': db.query_count - queries_before,
+        'queries_per_request': round((db.query_count - queries_before) / count, 2) if count else None,
+    }
+    return name, report, results
+
+async def run_race(app, db, sessions, attempts, day, rng):
+    # Гонка за один свободный слот: все запросы уходят одновременно от разных пользователей,
+    # записаться должен ровно один, остальные получают 400 "Это время уже занято"
+    court = next(court for court in schedule.catalog().courts if day not in court.blackout)
+    time_slot = rng.choice(court.time_slots)
+    body = {'court_type': court.code, 'date': schedule.day_string(day), 'time_slot': time_slot}
+    users = rng.sample(sorted(sessions), min(attempts, len(sessions)))
+    calls = [('POST', '/api/book', None, body, user_id) for user_id in users]
+    name, report, results = await run_phase(app, db, 'POST /api/book (one slot)', calls, len(calls), sessions)
+
+    taken = storage.BOOKING_CONFLICTS['bookings.day, bookings.court_id, bookings.slot']
+    rows = await storage.backend.day_bookings(day)
+    report['slot'] = body
+    report['stored'] = sum(1 for row in rows if row['court_id'] == court.id and row['slot'] == court.slot_index[time_slot])
+    report['ok'] = (
+        report['statuses'].get('200') == 1
+        and all(status == 200 or (status == 400 and data['detail'] == taken) for status, data, _, _ in results)
+        and report['stored'] == 1
+    )
+    return name, report
+
+async def run_consistency(app, db, sessions, days, concurrency, rng):
+    # Записи и чтения сетки вперемешку по свободным дням; после них /api/slots должен совпасть с базой.
+    # Ловит устаревшую загрузку копии в памяти (--storage replica), затершую более свежую, и кэш сетки поверх нее.
+    # Окно гонки зависит от планировщика, так что это проверка согласованности, а не гарантированное воспроизведение
+    catalog = schedule.catalog()
+    period = {'from': schedule.day_string(days[0]), 'to': schedule.day_string(days[-1])}
+    calls = []
+    for day in days:
+        date = schedule.day_string(day)
+        for court in catalog.courts:
+            for time_slot in court.time_slots:
+                body = {'court_type': court.code, 'date': date, 'time_slot': time_slot}
+                calls.append(('POST', '/api/book', None, body, rng.choice(list(sessions))))
+                calls.extend(('GET', '/api/slots', {'date': date}, None, None) for _ in range(3))
+                calls.append(('GET', '/api/availability', period, None, None))
+    name, report, _ = await run_phase(app, db, 'POST /api/book + GET /api/slots + GET /api/availability', calls, concurrency, sessions)
+
+    report['mismatched_days'] = []
+    for day in days:
+        status, slots = await asgi_request(app, 'GET', '/api/slots', {'date': schedule.day_string(day)})
+        shown = {(slot['court_type'], slot['time_slot'], slot['booking_id']) for slot in slots if slot['booking_id']}
+        stored = {
+            (catalog.court_code(row['court_id']), catalog.slot_name(row['court_id'], row['slot']), row['id'])
+            for row in await db.run(storage.fetch_day_bookings, day)
+        }
+        if status != 200 or shown != stored:
+            report['mismatched_days'].append(schedule.day_string(day))
+    report['ok'] = not report['mismatched_days']
+    return name, report
+
+async def run(args):
+    rng = random.Random(args.seed)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='tennis-bench-'), 'bench.db')
+    db = CountingDatabase(db_path=db_path, pool_size=args.pool_size)
+    db.initialize()
+    days, booking_count = seed(db_path, args.users, args.days_back, args.days_ahead, args.fill, rng)
+    database.db = db
+    if not args.rate_limit:
+        # Все запросы бенчмарка идут с одного адреса - лимитер отключаем
+        ratelimit.slots_limiter = ratelimit.TokenBucketLimiter(math.inf, math.inf)
+        ratelimit.book_limiter = ratelimit.TokenBucketLimiter(math.inf, math.inf)
+    storage.STORAGE = args.storage
+    auth.sessions = auth.SessionCache(BENCH_BOT_TOKEN)
+    sessions = {user_id: init_data(user_id, auth.sessions.key) for user_id in range(1, args.users + 1)}
+
+    days = [schedule.day_string(day) for day in days]
+    future_days = days[args.days_back:]
+    courts = schedule.catalog().courts
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'dataset': {'db_path': db_path, 'users': args.users, 'days': len(days), 'bookings': booking_count},
+        'endpoints': {},
+    }
+
+    async with main.lifespan(main.app):
+        if args.storage == 'memory':
+            # Хранилище в памяти заполняем теми же данными, что записаны в базу
+            first, last = schedule.day_number(days[0]), schedule.day_number(days[-1])
+            storage.backend.replace_days(first, last, await db.run(storage.fetch_replica_rows, first, last))
+        phases = []
+
+        slot_calls = [('GET', '/api/slots', {'date': rng.choice(days)}, None, None) for _ in range(args.requests)]
+        phases.append(await run_phase(main.app, db, 'GET /api/slots', slot_calls, args.concurrency, sessions))
+
+        book_calls = []
+        for _ in range(args.requests):
+            court = rng.choice(courts)
+            book_calls.append(('POST', '/api/book', None, {
+                'court_type': court.code,
+                'date': rng.choice(future_days),
+                'time_slot': rng.choice(court.time_slots),
+            }, rng.randint(1, args.users)))
+        phases.append(await run_phase(main.app, db, 'POST /api/book', book_calls, args.concurrency, sessions))
+
+        user_calls = [('GET', '/api/my-bookings', None, None, rng.randint(1, args.users))
+                      for _ in range(args.requests)]
+        name, my_report, my_results = await run_phase(
+            main.app, db, 'GET /api/my-bookings', user_calls, args.concurrency, sessions
+        )
+        phases.append((name, my_report, my_results))
+
+        # Отменяем реальные записи пользователей, найденные на предыдущем шаге
+        cancel_calls = []
+        for status, data, user_id, _ in my_results:
+            if status == 200 and data:
+                booking = rng.choice(data)
+                cancel_calls.append(('DELETE', f"/api/booking/{booking['id']}", None, None, user_id))
+        cancel_calls = list({call[1]: call for call in cancel_calls}.values())[:args.requests]
+        phases.append(await run_phase(main.app, db, 'DELETE /api/booking/{id}', cancel_calls, args.concurrency, sessions))
+
+        for name, phase_report, _ in phases:
+            report['endpoints'][name] = phase_report
+        report['cache'] = main.availability_cache.stats()
+        report['sessions'] = auth.sessions.stats()
+        if args.race:
+            # День сразу после наполненных, чтобы слот и игроки были свободны
+            name, race_report = await run_race(
+                main.app, db, sessions, args.race, schedule.today_number() + args.days_ahead, rng
+            )
+            report['endpoints'][name] = race_report
+            report['race_ok'] = race_report['ok']
+        if args.consistency_days and args.storage != 'memory':
+            # Хранилище в памяти в базу не пишет - сравнивать не с чем
+            first = schedule.today_number() + args.days_ahead + 1
+            name, consistency_report = await run_consistency(
+                main.app, db, sessions, range(first, first + args.consistency_days), args.concurrency, rng
+            )
+            report['endpoints'][name] = consistency_report
+            report['consistency_ok'] = consistency_report['ok']
+        # Регрессия плана: списки пользователя без полного чтения таблицы и сортировки
+        report['query_plan_problems'] = await db.run(storage.check_query_plans)
+
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Бенчмарк API записи на корт')
+    parser.add_argument('--users', type=int, default=3000, help='сколько пользователей создать')
+    parser.add_argument('--days-back', type=int, default=60, help='дней истории до сегодня')
+    parser.add_argument('--days-ahead', type=int, default=30, help='дней расписания после сегодня')
+    parser.add_argument('--fill', type=float, default=0.6, help='доля занятых слотов в день')
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на каждый эндпоинт')
+    parser.add_argument('--concurrency', type=int, default=20, help='одновременных клиентов')
+    parser.add_argument('--pool-size', type=int, default=4, help='размер пула соединений')
+    parser.add_argument('--race', type=int, default=300,
+                        help='одновременных записей на один слот в проверке гонки, 0 - не проверять')
+    parser.add_argument('--consistency-days', type=int, default=5,
+                        help='свободных дней для проверки сетки после записей вперемешку с чтениями, 0 - не проверять')
+    parser.add_argument('--seed', type=int, default=1, help='seed генератора случайных чисел')
+    parser.add_argument('--rate-limit', action='store_true', help='не отключать ограничение частоты запросов')
+    parser.add_argument('--storage', choices=('sqlite', 'replica', 'memory'), default=storage.STORAGE,
+                        help='хранилище записей, см. storage.py')
+    parser.add_argument('--db', help='путь к базе для бенчмарка (по умолчанию временный файл)')
+    parser.add_argument('--output', help='куда сохранить JSON-отчет')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    if result['query_plan_problems'] or not result.get('race_ok', True) or not result.get('consistency_ok', True):
+        sys.exit(1)
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+
+import analytics
+import events
+import schedule
+
+# Выгрузка идет порциями по ключу (day, court_id, slot, id): соединение не держится
+# открытым на все время ответа, а в памяти не больше одной порции
+EXPORT_CHUNK = 1000
+EXPORT_COLUMNS = ('id', 'date', 'court_type', 'time_slot', 'user_id', 'first_name', 'created_at', 'status')
+EXPORT_SOURCES = (('bookings_archive', 'archived'), ('bookings', 'active'))
+MAX_IMPORT_ROWS = 20000
+# user_id должен помещаться в 64-битный INTEGER SQLite
+MAX_USER_ID = 2 ** 63 - 1
+
+def fetch_export_chunk(conn, table, after, day_to, limit):
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT b.day, b.court_id, b.slot, b.id, b.user_id, u.first_name, b.created_at
+        FROM {table} b
+        LEFT JOIN users u ON b.user_id = u.user_id
+        WHERE (b.day, b.court_id, b.slot, b.id) > (?, ?, ?, ?) AND b.day <= ?
+        ORDER BY b.day, b.court_id, b.slot, b.id
+        LIMIT ?
+    ''', (*after, day_to, limit))
+    return cursor.fetchall()
+
+def export_row(row, status):
+    catalog = schedule.catalog()
+    return {
+        "id": row['id'],
+        "date": schedule.day_string(row['day']),
+        "court_type": catalog.court_code(row['court_id']),
+        "time_slot": catalog.slot_name(row['court_id'], row['slot']),
+        "user_id": row['user_id'],
+        "first_name": row['first_name'],
+        "created_at": row['created_at'],
+        "status": status
+    }
+
+async def export_chunks(db, day_from, day_to, chunk_size=EXPORT_CHUNK):
+    # Сначала архив (прошедшие дни), затем действующие записи
+    for table, status in EXPORT_SOURCES:
+        after = (day_from, -1, -1, -1)
+        while True:
+            rows = await db.run(fetch_export_chunk, table, after, day_to, chunk_size)
+            if not rows:
+                break
+            yield [export_row(row, status) for row in rows]
+            if len(rows) < chunk_size:
+                break
+            last = rows[-1]
+            after = (last['day'], last['court_id'], last['slot'], last['id'])
+
+async def stream_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+async def stream_ndjson(chunks):
+    async for rows in chunks:
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+def read_import_rows(body, fmt):
+    # CSV из таблиц (заголовок date,court_type,time_slot,user_id[,first_name]) или NDJSON
+    text = body.decode('utf-8-sig')
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    rows = []
+    for line in text.splitlines():
+        if line.strip():
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+    return rows
+
+def import_user_id(value):
+    # Строка из CSV или целое число из NDJSON в пределах 1..MAX_USER_ID; true и 1.5 не принимаются
+    if isinstance(value, str) and value.strip().isascii() and value.strip().isdigit():
+        value = int(value)
+    if type(value) is not int or not 1 <= value <= MAX_USER_ID:
+        raise ValueError(value)
+    return value
+
+def parse_import_row(row, catalog):
+    # Возвращает (user_id, first_name, day, court_id, slot) или строку ошибки.
+    # Значения из NDJSON могут быть любого типа JSON - в базу уходят только проверенные
+    if not isinstance(row, dict):
+        return "Неверный формат строки"
+    try:
+        user_id = import_user_id(row.get('user_id'))
+        day = schedule.day_number(row['date'])
+    except (KeyError, TypeError, ValueError):
+        return "Неверный user_id или дата"
+    first_name = row.get('first_name')
+    if first_name is not None and not isinstance(first_name, str):
+        return "Неверное имя"
+    court_type = row.get('court_type')
+    court = catalog.by_code.get(court_type) if isinstance(court_type, str) else None
+    if court is None:
+        return "Неизвестный корт"
+    time_slot = row.get('time_slot')
+    slot = court.slot_index.get(time_slot) if isinstance(time_slot, str) else None
+    if slot is None:
+        return "Неизвестное время"
+    if day in court.blackout:
+        return "Корт закрыт в этот день"
+    return user_id, first_name or f"User {user_id}", day, court.id, slot
+
+def import_bookings(conn, items, all_or_nothing):
+    # items: (user_id, first_name, day, court_id, slot) или None для строк с ошибкой формата.
+    # Все строки вставляются одним executemany в одной транзакции; конфликты по UNIQUE
+    # пропускаются и потом определяются по тому, чья запись заняла слот
+    valid = [item for item in items if item is not None]
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+
+    # Резервируем id сразу на все строки; у пропущенных строк номера просто не используются
+    cursor.execute("UPDATE sequences SET value = value + ? WHERE name = 'bookings'", (len(valid),))
+    last_id = cursor.execute("SELECT value FROM sequences WHERE name = 'bookings'").fetchone()[0]
+    rows = [(last_id - len(valid) + i + 1, *item) for i, item in enumerate(valid)]
+
+    cursor.executemany(
+        'INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
+        [(user_id, first_name) for _, user_id, first_name, *_ in rows]
+    )
+    cursor.executemany(
+        'INSERT OR IGNORE INTO bookings (id, user_id, day, court_id, slot) VALUES (?, ?, ?, ?, ?)',
+        [(booking_id, user_id, day, court_id, slot) for booking_id, user_id, _, day, court_id, slot in rows]
+    )
+
+    outcomes = iter(rows)
+    results = []
+    for item in items:
+        if item is None:
+            results.append(None)
+            continue
+        booking_id, _, _, day, court_id, slot = next(outcomes)
+        holder = cursor.execute(
+            'SELECT id FROM bookings WHERE day = ? AND court_id = ? AND slot = ?',
+            (day, court_id, slot)
+        ).fetchone()
+        if holder is None:
+            results.append("Пользователь уже записан на этот день")
+        elif holder['id'] != booking_id:
+            results.append("Это время уже занято")
+        else:
+            results.append(booking_id)
+
+    failed = any(not isinstance(result, int) for result in results)
+    if all_or_nothing and failed:
+        conn.rollback()
+    else:
+        analytics.record_bookings(cursor, [
+            (*item[2:], 1, 0) for item, result in zip(items, results) if isinstance(result, int)
+        ])
+        # Затронуты могут быть любые дни и пользователи - другие воркеры сбрасывают кэш целиком
+        if any(isinstance(result, int) for result in results):
+            events.write_outbox(cursor, [{"reset": True}])
+        conn.commit()
+    return results
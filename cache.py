@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+class AvailabilityCache:
+    # LRU-кэш сетки слотов по ключу (date, court_type)
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._items = OrderedDict()
+
+    def get(self, date, court_type):
+        key = (date, court_type)
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, date, court_type, value, generation):
+        # Если пока читали из базы была запись, результат мог устареть - не кладем
+        if generation != self.generation:
+            return
+        key = (date, court_type)
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, date, court_type):
+        self.generation += 1
+        self._items.pop((date, court_type), None)
+
+    def clear(self):
+        self.generation += 1
+        self._items.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._items),
+            "max_size": self.max_size
+        }
+
+# Кэш живет в процессе воркера; все обращения идут из event loop
+availability_cache = AvailabilityCache()
@@ -1,20 +1,218 @@
 import sqlite3
 import os
+import asyncio
+import logging
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import schedule
+
+logger = logging.getLogger(__name__)
+
+# Профиль соединения: WAL, чтобы запись не блокировала читателей /api/slots
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 64 * 1024 * 1024,
+    'cache_size': -16000,
+}
+STATEMENT_CACHE_SIZE = 256
+# PRAGMA synchronous читается обратно числом
+SYNCHRONOUS_LEVELS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+# /data сохраняется между деплоями; для тестов и локального запуска путь задается через DB_PATH
+DB_PATH = os.getenv('DB_PATH', '/data/tennis_booking.db')
+# Версия схемы в таблице schema_version. Если в базе она не меньше, DDL при старте не выполняется.
+# Увеличивать при каждом изменении таблиц или индексов в init_database. 3 - сводка booking_stats,
+# 4 - индексы списка записей пользователя, 5 - таблица events
+SCHEMA_VERSION = 5
+
+class TimedCursor(sqlite3.Cursor):
+    # Сообщает наблюдателю соединения время каждого запроса
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.observe_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.observe_query(sql, time.perf_counter() - started)
+
+class TimedConnection(sqlite3.Connection):
+    observer = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def observe_query(self, sql, seconds):
+        if self.observer is not None:
+            self.observer.query(sql, seconds)
+
+    def close(self):
+        if self.observer is not None:
+            self.observer.connection_closed()
+        super().close()
+
+class DataVersions:
+    # Номера версий данных по дате и по пользователю; растут при каждой записи в bookings.
+    # По ним API отдает ETag и отвечает 304, не обращаясь к базе
+    def __init__(self):
+        self.started_at = time.time()
+        # Метка процесса: версии другого воркера никогда не совпадут с нашими
+        self.epoch = f'{os.getpid():x}.{int(self.started_at * 1000):x}'
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._dates = {}
+        self._users = {}
+
+    def bump(self, date=None, user_id=None):
+        with self._lock:
+            self._counter += 1
+            stamp = (self._counter, time.time())
+            if date is not None:
+                self._dates[date] = stamp
+            if user_id is not None:
+                self._users[user_id] = stamp
+
+    def reset(self):
+        # Массовое изменение (импорт): новая метка процесса делает недействительными все выданные ETag
+        with self._lock:
+            self._counter += 1
+            self.started_at = time.time()
+            self.epoch = f'{os.getpid():x}.{int(self.started_at * 1000):x}.{self._counter:x}'
+            self._dates.clear()
+            self._users.clear()
+
+    def for_date(self, date):
+        return self._dates.get(date, (0, self.started_at))
+
+    def for_user(self, user_id):
+        return self._users.get(user_id, (0, self.started_at))
 
 class Database:
-    def __init__(self, db_path="/data/tennis_booking.db"):
-        # Используем /data/ который сохраняется между деплоями
-        os.makedirs('/data', exist_ok=True)
-        self.db_path = db_path
-        self.init_database()
+    # Конструктор не трогает диск: файл и схема создаются в initialize() или open()
+    def __init__(self, db_path=None, pool_size=4, pragmas=None,
+                 statement_cache_size=STATEMENT_CACHE_SIZE, auto_migrate=True):
+        self.db_path = db_path or DB_PATH
+        self.pool_size = pool_size
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.statement_cache_size = statement_cache_size
+        self.auto_migrate = auto_migrate
+        self._pool = None
+        self._executor = None
+        # Наблюдатель (например metrics.registry): query(), call(), connection_opened/closed()
+        self.observer = None
+        self.versions = DataVersions()
+        self.initialized = False
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            factory=TimedConnection
+        )
         conn.row_factory = sqlite3.Row
+        if self.observer is not None:
+            conn.observer = self.observer
+            self.observer.connection_opened()
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
         return conn
 
+    def check_settings(self, conn):
+        # Проверяем, что sqlite действительно применил настройки профиля
+        settings = {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name in self.pragmas}
+        logger.info("SQLite %s settings for %s: %s", sqlite3.sqlite_version, self.db_path, settings)
+        for name, value in self.pragmas.items():
+            if name == 'synchronous':
+                value = SYNCHRONOUS_LEVELS.get(str(value).upper(), value)
+            if str(settings[name]).lower() != str(value).lower():
+                logger.warning("SQLite PRAGMA %s = %s, expected %s", name, settings[name], value)
+        return settings
+
+    async def open(self):
+        # Пул соединений и отдельные потоки под них, чтобы sqlite не блокировал event loop
+        if self._pool is not None:
+            return
+        if not self.initialized:
+            await asyncio.to_thread(self.initialize)
+        self._pool = queue.Queue(maxsize=self.pool_size)
+        for _ in range(self.pool_size):
+            self._pool.put(self.get_connection())
+        self.check_settings(self._pool.queue[0])
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='db')
+
+    async def close(self):
+        if self._pool is None:
+            return
+        self._executor.shutdown(wait=True)
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._pool = None
+        self._executor = None
+
+    def _call(self, func, args, queued_at):
+        conn = self._pool.get()
+        started = time.perf_counter()
+        try:
+            return func(conn, *args)
+        except BaseException as error:
+            # Соединение вернется в пул, поэтому незавершенную транзакцию откатываем
+            conn.rollback()
+            release_cursors(error)
+            raise
+        finally:
+            self._pool.put(conn)
+            if self.observer is not None:
+                self.observer.call(func.__name__, started - queued_at, time.perf_counter() - started)
+
+    async def run(self, func, *args):
+        # Выполняет func(conn, *args) на соединении из пула вне event loop
+        if self._pool is None:
+            raise RuntimeError("Database pool is not open")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args, time.perf_counter())
+
+    def initialize(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        started = time.perf_counter()
+        applied = self.init_database()
+        self.initialized = True
+        logger.info("Database %s ready in %.1f ms (schema %s)", self.db_path,
+                    (time.perf_counter() - started) * 1000, 'updated' if applied else 'current')
+
     def init_database(self):
+        # Возвращает True, если выполнялся DDL. При текущей схеме только синхронизируется справочник кортов
+        conn = sqlite3.connect(self.db_path)
+        current = read_schema_version(conn) >= SCHEMA_VERSION
+        if not current:
+            # Для новой базы: освобожденные архиватором страницы возвращаются через incremental_vacuum.
+            # Задается до перехода в WAL и до создания таблиц, на существующую базу не влияет
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.close()
+        if current:
+            conn = self.get_connection()
+            sync_courts(conn, schedule.catalog())
+            conn.close()
+            return False
+
         conn = self.get_connection()
         cursor = conn.cursor()
 
@@ -28,22 +226,237 @@ class Database:
             )
         ''')
 
-        # Таблица записей
+        # Справочник кортов, заполняется из каталога schedule
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE IF NOT EXISTS courts (
+                id INTEGER PRIMARY KEY,
+                code TEXT NOT NULL UNIQUE
+            )
+        ''')
+        sync_courts(conn, schedule.catalog())
+
+        # Счетчик id записей (у WITHOUT ROWID таблицы нет AUTOINCREMENT)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sequences (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('bookings', 0)")
+        conn.commit()
+
+        if is_legacy_bookings(conn):
+            if self.auto_migrate:
+                migrate_bookings(conn)
+        else:
+            create_bookings_table(conn, 'bookings')
+
+        if not is_legacy_bookings(conn):
+            # Список записей пользователя по ключу (day, slot, id), см. storage.fetch_user_bookings.
+            # Покрывающий: в WITHOUT ROWID индекс дописывается первичный ключ, с ним и court_id
+            cursor.execute('CREATE INDEX IF NOT EXISTS bookings_user ON bookings (user_id, day, slot, id)')
+
+        # Архив прошедших записей, см. archive.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bookings_archive (
+                id INTEGER PRIMARY KEY,
+                day INTEGER NOT NULL,
+                court_id INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                created_at DATETIME,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Выгрузка архива идет по дням, см. bulk.py
+        cursor.execute('CREATE INDEX IF NOT EXISTS bookings_archive_day ON bookings_archive (day, court_id, slot)')
+        # История пользователя (include_past) - тот же ключ, что и у bookings_user
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS bookings_archive_user ON bookings_archive (user_id, day, slot, id, court_id)'
+        )
+
+        # Очередь на занятые слоты: голова очереди - наименьший id
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS waitlist (
+                id INTEGER PRIMARY KEY,
+                day INTEGER NOT NULL,
+                court_id INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
                 user_id INTEGER NOT NULL,
-                court_type TEXT NOT NULL,
-                date TEXT NOT NULL,
-                time_slot TEXT NOT NULL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, date),
-                UNIQUE(court_type, date, time_slot)
+                UNIQUE (day, court_id, slot, user_id)
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS waitlist_user ON waitlist (user_id, day)')
+
+        # Сводка занятости для /api/stats, см. analytics.py. month - YYYYMM, weekday - 0 для понедельника
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS booking_stats (
+                month INTEGER NOT NULL,
+                court_id INTEGER NOT NULL,
+                weekday INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                cancellations INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (month, court_id, weekday, slot)
+            ) WITHOUT ROWID
+        ''')
 
+        # Сообщения об изменениях для других воркеров (outbox), см. events.SQLiteBroker.
+        # Пишутся в транзакции самого изменения, старые удаляет опрос брокера
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+
+        # Старую схему без auto_migrate не отмечаем: при следующем старте DDL выполнится снова
+        if not is_legacy_bookings(conn):
+            write_schema_version(conn, SCHEMA_VERSION)
         conn.commit()
         conn.close()
+        return True
+
+def release_cursors(error):
+    # Трейсбек ошибки держит кадры функции с ее курсорами. Если курсор освободит сборщик мусора
+    # в другом потоке, сброс его запроса ждет мьютекс соединения, которое уже выдано из пула
+    # и может ждать busy_timeout, - а поток со сборщиком при этом держит блокировку записи.
+    # Очищаем локальные переменные завершенных кадров, пока соединение еще у нас
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        traceback.clear_frames(error.__traceback__)
+        error = error.__cause__ or error.__context__
+
+def read_schema_version(conn):
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        # Таблицы еще нет - новая база или база до появления schema_version
+        return 0
+    return row[0] or 0
+
+def write_schema_version(conn, version):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO schema_version (version) VALUES (?)', (version,))
+
+def sync_courts(conn, catalog):
+    conn.executemany(
+        'INSERT INTO courts (id, code) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET code = excluded.code',
+        [(court.id, court.code) for court in catalog.courts]
+    )
+    conn.commit()
+
+# Таблица записей: день, корт и слот (минута начала) хранятся числами, ключ (day, court_id, slot)
+def create_bookings_table(conn, name):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            day INTEGER NOT NULL,
+            court_id INTEGER NOT NULL REFERENCES courts(id),
+            slot INTEGER NOT NULL,
+            id INTEGER NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (day, court_id, slot),
+            UNIQUE(user_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+def is_legacy_bookings(conn):
+    # Старая схема хранила court_type, date и time_slot строками
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(bookings)')]
+    return 'court_type' in columns
+
+def convert_legacy_rows(rows):
+    catalog = schedule.catalog()
+    converted = []
+    skipped = []
+    for row_id, user_id, court_type, date, time_slot, created_at in rows:
+        try:
+            court = catalog.by_code[court_type]
+            converted.append((
+                schedule.day_number(date),
+                court.id,
+                court.slot_index[time_slot],
+                row_id,
+                user_id,
+                created_at
+            ))
+        except (KeyError, ValueError):
+            skipped.append(row_id)
+    return converted, skipped
+
+def copy_legacy_batch(conn, after_id, batch_size):
+    rows = conn.execute(
+        'SELECT id, user_id, court_type, date, time_slot, created_at FROM bookings '
+        'WHERE id > ? ORDER BY id LIMIT ?',
+        (after_id, batch_size)
+    ).fetchall()
+    converted, skipped = convert_legacy_rows(rows)
+    conn.executemany(
+        'INSERT OR IGNORE INTO bookings_compact (day, court_id, slot, id, user_id, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        converted
+    )
+    last_id = rows[-1][0] if rows else after_id
+    return len(rows), len(converted), skipped, last_id
+
+def migrate_bookings(conn, batch_size=1000, drop_legacy=False):
+    # Онлайн-миграция со старой схемы: копируем короткими транзакциями,
+    # затем под одной блокировкой докопируем хвост, учтем отмены и подменим таблицы
+    report = {'copied': 0, 'skipped': [], 'batches': 0}
+    create_bookings_table(conn, 'bookings_compact')
+    conn.commit()
+
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM bookings_compact').fetchone()[0]
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        if not is_legacy_bookings(conn):
+            # Таблицы уже подменил другой воркер
+            conn.rollback()
+            return report
+        read, copied, skipped, last_id = copy_legacy_batch(conn, last_id, batch_size)
+        conn.commit()
+        report['batches'] += 1
+        report['copied'] += copied
+        report['skipped'].extend(skipped)
+        if read < batch_size:
+            break
+
+    conn.execute('BEGIN IMMEDIATE')
+    if not is_legacy_bookings(conn):
+        conn.rollback()
+        return report
+    while True:
+        read, copied, skipped, last_id = copy_legacy_batch(conn, last_id, batch_size)
+        report['copied'] += copied
+        report['skipped'].extend(skipped)
+        if read < batch_size:
+            break
+    conn.execute('DELETE FROM bookings_compact WHERE id NOT IN (SELECT id FROM bookings)')
+    last_legacy_id = conn.execute(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM bookings), 0), "
+        "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'bookings'), 0))"
+    ).fetchone()[0]
+    conn.execute("UPDATE sequences SET value = MAX(value, ?) WHERE name = 'bookings'", (last_legacy_id,))
+    conn.execute('DROP INDEX IF EXISTS idx_bookings_date')
+    conn.execute('ALTER TABLE bookings RENAME TO bookings_legacy')
+    conn.execute('ALTER TABLE bookings_compact RENAME TO bookings')
+    if drop_legacy:
+        conn.execute('DROP TABLE bookings_legacy')
+    conn.commit()
+
+    if report['skipped']:
+        logger.warning("Bookings not migrated (unknown court, date or slot): %s", report['skipped'])
+    logger.info("Migrated %s bookings to the compact schema in %s batches", report['copied'], report['batches'])
+    return report
 
-# Создаем базу данных
+# Объект базы без побочных эффектов при импорте; файл и схема создаются в lifespan (db.open())
 db = Database()
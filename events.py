@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# local - события только внутри процесса (один воркер, тесты),
+# sqlite - общая таблица events в базе (outbox), ее опрашивают все воркеры на одной машине
+EVENT_BROKER = os.getenv('EVENT_BROKER', 'sqlite')
+POLL_INTERVAL = 0.2
+EVENT_RETENTION = 60
+
+class LocalBroker:
+    # Брокер в памяти процесса: сообщения сразу возвращаются подписчику
+    outbox = False
+
+    def __init__(self):
+        self._handler = None
+
+    async def start(self, handler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    async def publish(self, message):
+        if self._handler is not None:
+            self._handler(message)
+
+def slot_change(date, court_type, time_slot, user_id, booked_by=None, booking_id=None):
+    # Слот занят записью booking_id или освободился (booking_id None); event уходит SSE-подписчикам
+    return {"date": date, "court_type": court_type, "user_id": user_id, "event": {
+        "court_type": court_type,
+        "date": date,
+        "time_slot": time_slot,
+        "is_available": booking_id is None,
+        "booked_by": booked_by,
+        "booking_id": booking_id
+    }}
+
+def cancel_changes(booking, user_id, promoted):
+    # Отмена записи booking (date, court_type, time_slot). Если слот сразу перешел первому в очереди,
+    # подписчики видят его занятым новым игроком, а у отменившего меняется только список записей
+    if promoted is None:
+        return [slot_change(booking['date'], booking['court_type'], booking['time_slot'], user_id)]
+    return [
+        {"date": booking['date'], "court_type": booking['court_type'], "user_id": user_id, "event": None},
+        slot_change(booking['date'], booking['court_type'], booking['time_slot'], promoted['user_id'],
+                    promoted['first_name'], promoted['booking_id'])
+    ]
+
+def write_outbox(cursor, messages):
+    # Вызывается внутри транзакции записи: сообщение попадает в events вместе с изменением или не попадает вовсе,
+    # поэтому другие воркеры не пропустят сброс кэша из-за сбоя после коммита. С брокером без outbox ничего не пишет
+    if not messages or not hub.broker.outbox:
+        return
+    now = time.time()
+    cursor.executemany(
+        'INSERT INTO events (payload, created_at) VALUES (?, ?)',
+        [(json.dumps({**message, "origin": hub.origin}, ensure_ascii=False), now) for message in messages]
+    )
+
+def last_event_id(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+def fetch_events(conn, after_id, prune_before):
+    rows = conn.execute(
+        'SELECT id, payload FROM events WHERE id > ? ORDER BY id LIMIT 500', (after_id,)
+    ).fetchall()
+    if prune_before is not None:
+        conn.execute('DELETE FROM events WHERE created_at < ?', (prune_before,))
+        conn.commit()
+    return rows
+
+class SQLiteBroker:
+    # Брокер для нескольких воркеров uvicorn: сообщения пишет в таблицу events транзакция самого изменения
+    # (write_outbox), каждый воркер читает новые строки раз в POLL_INTERVAL
+    outbox = True
+
+    def __init__(self, db, poll_interval=POLL_INTERVAL, retention=EVENT_RETENTION):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._handler = None
+        self._task = None
+        self._last_id = 0
+
+    async def start(self, handler):
+        self._handler = handler
+        self._last_id = await self.db.run(last_event_id)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._handler = None
+
+    async def _poll(self):
+        last_prune = time.time()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            prune_before = None
+            if time.time() - last_prune > self.retention:
+                last_prune = time.time()
+                prune_before = last_prune - self.retention
+            try:
+                rows = await self.db.run(fetch_events, self._last_id, prune_before)
+            except Exception:
+                logger.exception("Event poll failed")
+                continue
+            for row_id, payload in rows:
+                self._last_id = row_id
+                # Ошибка в одном сообщении не должна останавливать опрос
+                try:
+                    self._handler(json.loads(payload))
+                except Exception:
+                    logger.exception("Event %s handling failed", row_id)
+
+def make_broker(name, db):
+    if name == 'local':
+        return LocalBroker()
+    if name == 'sqlite':
+        return SQLiteBroker(db)
+    raise ValueError(f"Unknown event broker {name}")
+
+class EventHub:
+    # Изменения записей: применяются слушателями (кэш, версии) и рассылаются
+    # SSE-подписчикам по ключу (date, court_type); в другие воркеры уходят через брокер
+    def __init__(self, broker=None, queue_size=100):
+        self.broker = broker or LocalBroker()
+        self.queue_size = queue_size
+        self.origin = uuid.uuid4().hex
+        self._subscribers = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    async def start(self):
+        await self.broker.start(self.receive)
+
+    async def stop(self):
+        await self.broker.stop()
+        for queues in self._subscribers.values():
+            for queue in queues:
+                close_queue(queue)
+        self._subscribers.clear()
+
+    def subscribe(self, date, court_type):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault((date, court_type), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, date, court_type, queue):
+        queues = self._subscribers.get((date, court_type))
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[(date, court_type)]
+
+    async def publish(self, message):
+        # Вызывается после коммита изменения. Свой воркер видит его сразу, остальные - когда сообщение
+        # дойдет через брокер. Брокеру с outbox сообщение уже записано в той же транзакции (write_outbox)
+        self.apply(message)
+        if self.broker.outbox:
+            return
+        try:
+            await self.broker.publish({**message, "origin": self.origin})
+        except Exception:
+            # Запись в базе уже сохранена - не превращаем сбой рассылки в ошибку запроса
+            logger.exception("Event publish failed")
+
+    def receive(self, message):
+        if message.get("origin") != self.origin:
+            self.apply(message)
+
+    def apply(self, message):
+        for listener in self._listeners:
+            listener(message)
+        if message.get("event"):
+            self.dispatch(message["event"])
+
+    def dispatch(self, event):
+        key = (event['date'], event['court_type'])
+        for queue in list(self._subscribers.get(key, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать - отключаем, он переподключится и перечитает сетку
+                self.unsubscribe(*key, queue)
+                close_queue(queue)
+
+def close_queue(queue):
+    # Маркер конца потока для SSE-подписчика; в заполненной очереди он заменяет последнее событие
+    try:
+        queue.put_nowait(None)
+    except asyncio.QueueFull:
+        queue.get_nowait()
+        queue.put_nowait(None)
+
+def format_sse(event):
+    return f"event: slot\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+hub = EventHub()
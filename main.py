@@ -1,15 +1,56 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-import database
-import os
+from contextlib import asynccontextmanager
+from email.utils import formatdate
 from dotenv import load_dotenv
+from typing import List
+import orjson
 
+# Модули ниже читают настройки из окружения при импорте - .env загружаем раньше них
 load_dotenv()
-BOT_TOKEN = os.getenv('BOT_TOKEN')
 
-app = FastAPI(title="Tennis Court Booking")
+import analytics
+import auth
+import bulk
+import database
+import archive
+import schedule
+import assets
+import metrics
+import models
+import notify
+import ratelimit
+import storage
+from cache import availability_cache
+import events
+from events import hub, format_sse
+import asyncio
+import csv
+import os
+
+@asynccontextmanager
+async def lifespan(app):
+    assets.store.build()
+    database.db.observer = metrics.registry
+    await database.db.open()
+    storage.backend = storage.make_storage(storage.STORAGE, database.db)
+    await storage.backend.open()
+    hub.broker = events.make_broker(events.EVENT_BROKER, database.db)
+    await hub.start()
+    loop_watcher = asyncio.create_task(metrics.watch_event_loop(metrics.registry))
+    catalog_watcher = asyncio.create_task(schedule.watch_catalog(catalog_changed))
+    archiver = asyncio.create_task(archive.run_archiver(database.db, bookings_archived))
+    yield
+    archiver.cancel()
+    catalog_watcher.cancel()
+    loop_watcher.cancel()
+    await storage.backend.close()
+    await hub.stop()
+    await database.db.close()
+
+# Ответы сериализует orjson; горячие эндпоинты отдают готовые байты через json_response
+app = FastAPI(title="Tennis Court Booking", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Добавляем CORS для Telegram
 app.add_middleware(
@@ -19,538 +60,491 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware, metrics=metrics.registry)
 
-def generate_time_slots():
-    slots = []
-    for hour in range(6, 24):
-        start = f"{hour:02d}:00"
-        end = f"{(hour + 1):02d}:00"
-        slots.append(f"{start}-{end}")
-    return slots
+MAX_AVAILABILITY_DAYS = 62
+MAX_USER_BOOKINGS_LIMIT = 500
+STREAM_PING_INTERVAL = 15
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Запись на теннисный корт</title>
-        <style>
-            body { font-family: Arial; padding: 20px; }
-            .court { margin: 20px 0; padding: 10px; border: 1px solid #ccc; }
-            .slot { 
-                padding: 10px; 
-                margin: 5px; 
-                border: 1px solid #ddd; 
-                display: inline-block;
-                width: 150px;
-                text-align: center;
-            }
-            .available { background: #90EE90; cursor: pointer; }
-            .booked { background: #FFB6C1; }
-            .tabs { display: flex; margin-bottom: 20px; }
-            .tab { padding: 10px; border: 1px solid #ccc; cursor: pointer; }
-            .active { background: #007bff; color: white; }
-            .court-buttons { margin: 15px 0; }
-            .court-button { 
-                padding: 10px 20px; 
-                margin: 5px; 
-                border: 2px solid #007bff;
-                background: white;
-                cursor: pointer;
-                border-radius: 5px;
-            }
-            .court-button.active { 
-                background: #007bff; 
-                color: white; 
-            }
-            .slots-grid { 
-                display: grid; 
-                grid-template-columns: repeat(2, 1fr); 
-                gap: 10px; 
-                max-width: 400px;
-            }
-            .user-info {
-                background: #f0f8ff;
-                padding: 10px;
-                border-radius: 5px;
-                margin-bottom: 15px;
-                border-left: 4px solid #007bff;
-            }
-            .loading { 
-                display: none;
-                text-align: center; 
-                padding: 20px; 
-                color: #666; 
-            }
-            .error { 
-                display: none;
-                background: #ffebee; 
-                color: #c62828; 
-                padding: 10px; 
-                border-radius: 5px; 
-                margin: 10px 0; 
-            }
-        </style>
-    </head>
-    <body>
-        <div id="loading" class="loading">
-            <h2>🎾 Загружаем расписание...</h2>
-            <p>Пожалуйста, подождите</p>
-        </div>
-
-        <div id="content" style="display:none;">
-            <h1>🎾 Запись на теннисный корт</h1>
-            
-            <div id="user-info" class="user-info" style="display:none;">
-                Добро пожаловать, <span id="user-name">Гость</span>!
-                <button onclick="resetUser()" style="margin-left: 10px; font-size: 12px;">Сбросить</button>
-            </div>
-
-            <div id="error-message" class="error"></div>
-
-            <div class="tabs">
-                <div class="tab active" onclick="showTab('booking')">Записаться</div>
-                <div class="tab" onclick="showTab('my-bookings')">Мои записи</div>
-            </div>
-
-            <div id="booking-tab">
-                <h3>Выберите дату:</h3>
-                <input type="date" id="date-picker" onchange="loadSlots()">
-
-                <h3>Выберите корт:</h3>
-                <div class="court-buttons">
-                    <button id="court-rubber" class="court-button active" onclick="selectCourt('rubber')">Резиновый</button>
-                    <button id="court-hard" class="court-button" onclick="selectCourt('hard')">Хард</button>
-                </div>
-
-                <div id="slots-container"></div>
-            </div>
-
-            <div id="my-bookings-tab" style="display:none;">
-                <h3>Мои записи:</h3>
-                <div id="bookings-list"></div>
-            </div>
-        </div>
-
-        <script>
-            let currentCourt = 'rubber';
-            let currentUser = null;
-            let isInitialized = false;
-
-            function showLoading() {
-                document.getElementById('loading').style.display = 'block';
-                document.getElementById('content').style.display = 'none';
-            }
-
-            function hideLoading() {
-                document.getElementById('loading').style.display = 'none';
-                document.getElementById('content').style.display = 'block';
-            }
-
-            function showError(message) {
-                const errorDiv = document.getElementById('error-message');
-                errorDiv.textContent = message;
-                errorDiv.style.display = 'block';
-                setTimeout(() => errorDiv.style.display = 'none', 5000);
-            }
-
-            async function initTelegramUser() {
-                console.log('=== INIT TELEGRAM USER ===');
-                
-                try {
-                    // Быстрая инициализация - сначала проверяем localStorage
-                    const savedUser = localStorage.getItem('telegramUser');
-                    if (savedUser) {
-                        currentUser = JSON.parse(savedUser);
-                        console.log('📁 User from localStorage:', currentUser);
-                        showUserInfo(currentUser);
-                        return true;
-                    }
-                    
-                    // Проверяем Telegram WebApp (быстрая проверка)
-                    if (window.Telegram && window.Telegram.WebApp) {
-                        console.log('✅ Telegram WebApp detected');
-                        const tg = window.Telegram.WebApp;
-                        
-                        // Быстрая инициализация
-                        tg.ready();
-                        
-                        // Проверяем пользователя без долгих операций
-                        if (tg.initDataUnsafe && tg.initDataUnsafe.user) {
-                            const user = tg.initDataUnsafe.user;
-                            console.log('👤 User from Telegram:', user);
-                            
-                            currentUser = {
-                                id: user.id,
-                                first_name: user.first_name || 'Telegram User',
-                                username: user.username || '',
-                                last_name: user.last_name || '',
-                                language_code: user.language_code || 'ru'
-                            };
-                            
-                            localStorage.setItem('telegramUser', JSON.stringify(currentUser));
-                            showUserInfo(currentUser);
-                            return true;
-                        }
-                    }
-                    
-                    // Если не нашли пользователя - создаем гостя
-                    console.log('👤 Creating guest user');
-                    currentUser = { 
-                        id: Math.floor(Math.random() * 1000000), 
-                        first_name: 'Гость'
-                    };
-                    localStorage.setItem('telegramUser', JSON.stringify(currentUser));
-                    showUserInfo(currentUser);
-                    return true;
-                    
-                } catch (error) {
-                    console.error('Error initializing user:', error);
-                    // В случае ошибки всё равно создаем гостя
-                    currentUser = { 
-                        id: Math.floor(Math.random() * 1000000), 
-                        first_name: 'Гость'
-                    };
-                    showUserInfo(currentUser);
-                    return true;
-                }
-            }
-
-            function showUserInfo(user) {
-                try {
-                    const userName = user.first_name + (user.last_name ? ' ' + user.last_name : '');
-                    document.getElementById('user-name').textContent = userName;
-                    document.getElementById('user-info').style.display = 'block';
-                    console.log(`👤 User: ${userName}`);
-                } catch (error) {
-                    console.error('Error showing user info:', error);
-                }
-            }
-
-            function resetUser() {
-                localStorage.removeItem('telegramUser');
-                currentUser = null;
-                document.getElementById('user-info').style.display = 'none';
-                setTimeout(() => location.reload(), 100);
-            }
-
-            async function initializeApp() {
-                showLoading();
-                console.log('🚀 Initializing app...');
-                
-                try {
-                    // Инициализируем пользователя
-                    await initTelegramUser();
-                    
-                    // Устанавливаем сегодняшнюю дату
-                    document.getElementById('date-picker').value = new Date().toISOString().split('T')[0];
-                    
-                    // Загружаем слоты
-                    await loadSlots();
-                    
-                    // Показываем интерфейс
-                    hideLoading();
-                    isInitialized = true;
-                    console.log('✅ App initialized successfully');
-                    
-                } catch (error) {
-                    console.error('❌ App initialization failed:', error);
-                    hideLoading();
-                    showError('Ошибка загрузки. Пожалуйста, обновите страницу.');
-                }
-            }
-
-            function showTab(tabName) {
-                if (!isInitialized) return;
-                
-                document.querySelectorAll('.tab').forEach(tab => tab.classList.remove('active'));
-                event.target.classList.add('active');
-                
-                document.getElementById('booking-tab').style.display = 'none';
-                document.getElementById('my-bookings-tab').style.display = 'none';
-                document.getElementById(tabName + '-tab').style.display = 'block';
-
-                if (tabName === 'my-bookings') {
-                    loadMyBookings();
-                }
-            }
-
-            function selectCourt(court) {
-                if (!isInitialized) return;
-                
-                currentCourt = court;
-                document.getElementById('court-rubber').classList.remove('active');
-                document.getElementById('court-hard').classList.remove('active');
-                document.getElementById('court-' + court).classList.add('active');
-                loadSlots();
-            }
-
-            async function loadSlots() {
-                if (!isInitialized) return;
-                
-                const date = document.getElementById('date-picker').value;
-                if (!date) return;
-
-                try {
-                    const response = await fetch('/api/slots?date=' + date);
-                    if (!response.ok) throw new Error('Network error');
-                    
-                    const slots = await response.json();
-
-                    const container = document.getElementById('slots-container');
-                    container.innerHTML = '<h3>Доступные слоты:</h3>';
-                    
-                    const grid = document.createElement('div');
-                    grid.className = 'slots-grid';
-
-                    const courtSlots = slots
-                        .filter(slot => slot.court_type === currentCourt)
-                        .sort((a, b) => a.time_slot.localeCompare(b.time_slot));
-
-                    courtSlots.forEach(slot => {
-                        const slotElement = document.createElement('div');
-                        slotElement.className = 'slot ' + (slot.is_available ? 'available' : 'booked');
-                        slotElement.innerHTML = slot.time_slot.replace('-', '<br>') + 
-                            (slot.is_available ? '<br><small>Свободно</small>' : '<br><small>Занято: ' + slot.booked_by + '</small>');
-
-                        if (slot.is_available) {
-                            slotElement.onclick = () => bookSlot(slot);
-                        }
-
-                        grid.appendChild(slotElement);
-                    });
-
-                    container.appendChild(grid);
-                } catch (error) {
-                    console.error('Error loading slots:', error);
-                    showError('Ошибка загрузки расписания');
-                }
-            }
-
-            async function bookSlot(slot) {
-                if (!currentUser || !isInitialized) {
-                    alert('Приложение не готово');
-                    return;
-                }
-
-                if (!confirm('Записаться на ' + slot.time_slot + '?')) return;
-
-                try {
-                    const response = await fetch('/api/book', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({
-                            user_id: currentUser.id,
-                            first_name: currentUser.first_name,
-                            court_type: slot.court_type,
-                            date: slot.date,
-                            time_slot: slot.time_slot
-                        })
-                    });
-
-                    const result = await response.json();
-                    if (result.success) {
-                        alert('Успешно записаны!');
-                        loadSlots();
-                    } else {
-                        alert('Ошибка: ' + result.detail);
-                    }
-                } catch (error) {
-                    console.error('Error booking slot:', error);
-                    alert('Ошибка при записи');
-                }
-            }
-
-            async function loadMyBookings() {
-                if (!currentUser || !isInitialized) {
-                    alert('Приложение не готово');
-                    return;
-                }
-
-                try {
-                    const response = await fetch('/api/my-bookings?user_id=' + currentUser.id);
-                    const bookings = await response.json();
-
-                    const container = document.getElementById('bookings-list');
-                    container.innerHTML = '';
-
-                    if (bookings.length === 0) {
-                        container.innerHTML = '<p>У вас нет активных записей</p>';
-                        return;
-                    }
-
-                    bookings.forEach(booking => {
-                        const bookingElement = document.createElement('div');
-                        bookingElement.className = 'court';
-                        bookingElement.innerHTML = `
-                            <strong>${booking.date}</strong> ${booking.time_slot.replace('-', ' - ')} 
-                            (${booking.court_type === 'rubber' ? 'Резиновый' : 'Хард'})
-                            <button onclick="cancelBooking(${booking.id})" style="margin-left: 10px;">Отменить</button>
-                        `;
-                        container.appendChild(bookingElement);
-                    });
-                } catch (error) {
-                    console.error('Error loading bookings:', error);
-                    showError('Ошибка загрузки записей');
-                }
-            }
-
-            async function cancelBooking(bookingId) {
-                if (!confirm('Отменить запись?')) return;
-
-                try {
-                    const response = await fetch('/api/booking/' + bookingId + '?user_id=' + currentUser.id, {
-                        method: 'DELETE'
-                    });
-
-                    const result = await response.json();
-                    alert(result.message);
-                    loadMyBookings();
-                } catch (error) {
-                    console.error('Error canceling booking:', error);
-                    alert('Ошибка при отмене записи');
-                }
-            }
-
-            // Инициализация при загрузке
-            document.addEventListener('DOMContentLoaded', function() {
-                console.log('📄 DOM loaded');
-                setTimeout(() => {
-                    initializeApp();
-                }, 100);
-            });
-
-            // Резервная инициализация на случай если что-то пошло не так
-            setTimeout(() => {
-                if (!isInitialized) {
-                    console.log('🕒 Backup initialization');
-                    initializeApp();
-                }
-            }, 5000);
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
-
-# Остальной код API без изменений
-@app.get("/api/slots")
-async def get_slots(date: str = Query(...)):
-    conn = database.db.get_connection()
-    cursor = conn.cursor()
-
-    time_slots = generate_time_slots()
-    court_types = ['rubber', 'hard']
+async def read_root(request: Request):
+    return assets.store.respond(request, "index.html")
+
+@app.get("/static/{name}")
+async def get_static(name: str, request: Request):
+    return assets.store.respond(request, name)
+
+def parse_day(value):
+    try:
+        return schedule.day_number(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
+
+def get_court(catalog, court_type):
+    court = catalog.by_code.get(court_type)
+    if court is None:
+        raise HTTPException(status_code=400, detail="Неизвестный корт")
+    return court
+
+def parse_booking(booking):
+    # Переводим поля models.SlotRequest в числовые коды схемы; формат уже проверен, здесь - каталог
+    day = parse_day(booking.date)
+    court = get_court(schedule.catalog(), booking.court_type)
+    slot = court.slot_index.get(booking.time_slot)
+    if slot is None:
+        raise HTTPException(status_code=400, detail="Неизвестное время")
+    if day in court.blackout:
+        raise HTTPException(status_code=400, detail="Корт закрыт в этот день")
+    return day, court.id, slot
+
+def json_response(body, response):
+    # body уже сериализован orjson: FastAPI не прогоняет его через jsonable_encoder и модель ответа.
+    # Заголовки (ETag) переносим из response, который FastAPI иначе бы отбросил
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
+
+def apply_booking_change(message):
+    # Слушатель hub: сбрасывает кэш и версии для ETag, и для своих изменений, и пришедших из других воркеров
+    if message.get('reset'):
+        availability_cache.clear()
+        database.db.versions.reset()
+        if storage.backend is not None:
+            storage.backend.invalidate_all()
+        return
+    availability_cache.invalidate(message['date'], message['court_type'])
+    if storage.backend is not None:
+        storage.backend.invalidate(schedule.day_number(message['date']))
+    database.db.versions.bump(date=message['date'], user_id=message['user_id'])
+
+hub.add_listener(apply_booking_change)
+
+async def bookings_changed(messages):
+    # Вызывается после каждой записи в bookings с теми же сообщениями (events.slot_change, cancel_changes),
+    # что транзакция записала в outbox для других воркеров
+    for message in messages:
+        await hub.publish(message)
+
+def check_not_modified(request, response, version, tag):
+    # Условный GET: ETag по номеру версии данных, 304 если клиент уже видел эту версию
+    number, modified_at = version
+    etag = f'"{database.db.versions.epoch}-{tag}-{number}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified_at, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
+
+async def bookings_archived(total):
+    # Архив затрагивает много прошедших дней и пользователей сразу - как и после импорта,
+    # сбрасываем кэш и ETag целиком одним сообщением
+    await hub.publish({"reset": True})
+
+async def catalog_changed(catalog):
+    # Сетки слотов зависят от каталога - сбрасываем кэш и дописываем новые корты в справочник
+    availability_cache.clear()
+    await database.db.run(database.sync_courts, catalog)
+
+def build_court_slots(date, court, booked, closed):
     slots = []
+    court_type = court.code
+
+    for slot, time_slot in zip(court.starts, court.time_slots):
+        booking = booked.get((court.id, slot))
+
+        if closed:
+            slots.append({
+                "court_type": court_type,
+                "date": date,
+                "time_slot": time_slot,
+                "is_available": False,
+                "booked_by": None,
+                "booking_id": None
+            })
+        elif booking:
+            slots.append({
+                "court_type": court_type,
+                "date": date,
+                "time_slot": time_slot,
+                "is_available": False,
+                "booked_by": booking['first_name'],
+                "booking_id": booking['id']
+            })
+        else:
+            slots.append({
+                "court_type": court_type,
+                "date": date,
+                "time_slot": time_slot,
+                "is_available": True,
+                "booked_by": None,
+                "booking_id": None
+            })
 
-    for court_type in court_types:
-        for time_slot in time_slots:
-            cursor.execute('''
-                SELECT b.id, u.first_name 
-                FROM bookings b 
-                LEFT JOIN users u ON b.user_id = u.user_id 
-                WHERE b.court_type = ? AND b.date = ? AND b.time_slot = ?
-            ''', (court_type, date, time_slot))
-
-            booking = cursor.fetchone()
-
-            if booking:
-                slots.append({
-                    "court_type": court_type,
-                    "date": date,
-                    "time_slot": time_slot,
-                    "is_available": False,
-                    "booked_by": booking['first_name'],
-                    "booking_id": booking['id']
-                })
-            else:
-                slots.append({
-                    "court_type": court_type,
-                    "date": date,
-                    "time_slot": time_slot,
-                    "is_available": True,
-                    "booked_by": None,
-                    "booking_id": None
-                })
-
-    conn.close()
     return slots
 
-@app.post("/api/book")
-async def create_booking(booking_data: dict):
-    conn = database.db.get_connection()
-    cursor = conn.cursor()
+def serialize_slots(slots):
+    # В кэше лежит JSON сетки корта без скобок, ответ на день склеивается из этих кусков
+    return orjson.dumps(slots)[1:-1]
 
-    # Проверяем запись на этот день
-    cursor.execute(
-        'SELECT id FROM bookings WHERE user_id = ? AND date = ?',
-        (booking_data['user_id'], booking_data['date'])
-    )
-    if cursor.fetchone():
-        raise HTTPException(status_code=400, detail="Вы уже записаны на этот день")
-
-    # Проверяем свободен ли слот
-    cursor.execute(
-        'SELECT id FROM bookings WHERE court_type = ? AND date = ? AND time_slot = ?',
-        (booking_data['court_type'], booking_data['date'], booking_data['time_slot'])
-    )
-    if cursor.fetchone():
-        raise HTTPException(status_code=400, detail="Это время уже занято")
+@app.get("/api/slots", response_model=List[models.SlotResponse])
+async def get_slots(request: Request, response: Response, date: str = Query(..., pattern=models.DATE_PATTERN)):
+    ratelimit.slots_limiter.check(ratelimit.client_ip(request))
+    day = parse_day(date)
+    catalog = schedule.catalog()
 
-    # Сохраняем пользователя
-    cursor.execute(
-        'INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
-        (booking_data['user_id'], booking_data['first_name'])
+    not_modified = check_not_modified(
+        request, response, database.db.versions.for_date(date), f"slots-{catalog.version}-{date}"
     )
-
-    # Создаем запись
-    cursor.execute(
-        'INSERT INTO bookings (user_id, court_type, date, time_slot) VALUES (?, ?, ?, ?)',
-        (booking_data['user_id'], booking_data['court_type'], booking_data['date'], booking_data['time_slot'])
+    if not_modified:
+        return not_modified
+
+    cached = {court.code: availability_cache.get(date, court.code) for court in catalog.courts}
+
+    if any(court_slots is None for court_slots in cached.values()):
+        generation = availability_cache.generation
+        rows = await storage.backend.day_bookings(day)
+        booked = {(row['court_id'], row['slot']): row for row in rows}
+
+        for court in catalog.courts:
+            if cached[court.code] is None:
+                court_slots = serialize_slots(build_court_slots(date, court, booked, day in court.blackout))
+                availability_cache.put(date, court.code, court_slots, generation)
+                cached[court.code] = court_slots
+
+    body = b'[' + b','.join(court_slots for court_slots in cached.values() if court_slots) + b']'
+    return json_response(body, response)
+
+@app.get("/api/courts")
+async def get_courts():
+    catalog = schedule.catalog()
+    return {"version": catalog.version, "courts": [court.describe() for court in catalog.courts]}
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    stats = {**availability_cache.stats(), "sessions": auth.sessions.stats()}
+    if getattr(storage.backend, 'writer', None) is not None:
+        stats["writes"] = storage.backend.writer.stats()
+    return stats
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/availability")
+async def get_availability(
+    date_from: str = Query(..., alias="from", pattern=models.DATE_PATTERN),
+    date_to: str = Query(..., alias="to", pattern=models.DATE_PATTERN),
+    court: str = Query(None, pattern=models.COURT_PATTERN)
+):
+    # Занятость за период: на каждый корт и день битовая маска по сетке корта из /api/courts,
+    # бит i установлен, если слот time_slots[i] занят или корт закрыт. Имена берутся из /api/slots по запросу
+    try:
+        start = schedule.day_number(date_from)
+        end = schedule.day_number(date_to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
+
+    if end < start:
+        raise HTTPException(status_code=400, detail="Неверный период")
+    if end - start >= MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail="Слишком большой период")
+
+    catalog = schedule.catalog()
+    courts = [get_court(catalog, court)] if court is not None else catalog.courts
+    days = [schedule.day_string(day) for day in range(start, end + 1)]
+    masks = {
+        c.id: [c.full_mask if day in c.blackout else 0 for day in range(start, end + 1)]
+        for c in courts
+    }
+
+    court_id = courts[0].id if court is not None else None
+    rows = await storage.backend.range_bookings(start, end, court_id)
+
+    for row_court_id, day, slot in rows:
+        position = catalog.by_id[row_court_id].positions.get(slot) if row_court_id in masks else None
+        if position is not None:
+            masks[row_court_id][day - start] |= 1 << position
+
+    return {
+        "from": days[0],
+        "to": days[-1],
+        "time_slots": {c.code: c.time_slots for c in courts},
+        "courts": {c.code: dict(zip(days, masks[c.id])) for c in courts}
+    }
+
+@app.get("/api/stats")
+async def get_stats(
+    month_from: str = Query(None, alias="from", pattern=models.MONTH_PATTERN),
+    month_to: str = Query(None, alias="to", pattern=models.MONTH_PATTERN)
+):
+    # Загрузка кортов за месяцы from..to (YYYY-MM, по умолчанию текущий): доля занятых мест
+    # по дням недели, слотам и их сочетаниям. Читается только сводка booking_stats, не записи
+    current = schedule.day_string(schedule.today_number())[:7]
+    try:
+        start = analytics.month_number(month_from or month_to or current)
+        end = analytics.month_number(month_to or month_from or current)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный месяц")
+
+    span = (end // 100 - start // 100) * 12 + end % 100 - start % 100 + 1
+    if span < 1:
+        raise HTTPException(status_code=400, detail="Неверный период")
+    if span > analytics.MAX_STATS_MONTHS:
+        raise HTTPException(status_code=400, detail="Слишком большой период")
+    months = analytics.months_between(start, end)
+
+    rows = await storage.backend.occupancy(start, end)
+    catalog = schedule.catalog()
+    return {
+        "from": f"{start // 100:04d}-{start % 100:02d}",
+        "to": f"{end // 100:04d}-{end % 100:02d}",
+        "weekdays": analytics.WEEKDAYS,
+        "time_slots": {court.code: court.time_slots for court in catalog.courts},
+        "courts": analytics.build_report(rows, catalog, months)
+    }
+
+@app.get("/api/slots/stream")
+async def stream_slots(
+    date: str = Query(..., pattern=models.DATE_PATTERN),
+    court: str = Query(..., pattern=models.COURT_PATTERN)
+):
+    # Server-Sent Events: изменения слотов выбранного дня и корта
+    get_court(schedule.catalog(), court)
+
+    queue = hub.subscribe(date, court)
+
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            hub.unsubscribe(date, court, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    conn.commit()
-    conn.close()
+@app.post("/api/book", response_model=models.MessageResponse)
+async def create_booking(booking: models.BookingCreate, user: dict = Depends(auth.current_user)):
+    # Пользователь берется только из проверенного initData, user_id из тела запроса не используется
+    user_id = user['id']
+    first_name = user.get('first_name', '')
+    ratelimit.book_limiter.check(f"user:{user_id}")
+    day, court_id, slot = parse_booking(booking)
+    booking_id = await storage.backend.book(user_id, first_name, day, court_id, slot)
+    await bookings_changed([
+        events.slot_change(booking.date, booking.court_type, booking.time_slot, user_id, first_name, booking_id)
+    ])
 
     return {"success": True, "message": "Запись успешно создана!"}
 
-@app.get("/api/my-bookings")
-async def get_my_bookings(user_id: int = Query(...)):
-    conn = database.db.get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT id, court_type, date, time_slot 
-        FROM bookings 
-        WHERE user_id = ? AND date >= date('now') 
-        ORDER BY date, time_slot
-    ''', (user_id,))
-
-    bookings = cursor.fetchall()
-    conn.close()
-
-    return [dict(booking) for booking in bookings]
-
-@app.delete("/api/booking/{booking_id}")
-async def cancel_booking(booking_id: int, user_id: int = Query(...)):
-    conn = database.db.get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        'DELETE FROM bookings WHERE id = ? AND user_id = ?',
-        (booking_id, user_id)
+def expand_recurrence(recurrence):
+    # Повторяющаяся запись: тот же корт и время каждые interval_weeks недель, начиная с start_date.
+    # Границы count и interval_weeks проверяет models.Recurrence
+    start = parse_day(recurrence.start_date)
+    try:
+        dates = [schedule.day_string(start + i * 7 * recurrence.interval_weeks) for i in range(recurrence.count)]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверное правило повторения")
+    return [
+        models.SlotRequest(court_type=recurrence.court_type, date=date, time_slot=recurrence.time_slot)
+        for date in dates
+    ]
+
+@app.post("/api/book/batch", response_model=models.BatchResponse, response_model_exclude_none=True)
+async def create_booking_batch(batch: models.BatchCreate, user: dict = Depends(auth.current_user)):
+    # Пакетная запись: список слотов или правило повторения, одной транзакцией.
+    # mode=all_or_nothing - при любой ошибке ничего не сохраняется, best_effort - сохраняется что получилось
+    user_id = user['id']
+    first_name = user.get('first_name', '')
+    ratelimit.book_limiter.check(f"user:{user_id}")
+
+    mode = batch.mode
+    if batch.recurrence is not None:
+        requested = expand_recurrence(batch.recurrence)
+    else:
+        requested = batch.items or []
+    if not requested:
+        raise HTTPException(status_code=400, detail="Нет записей")
+    if len(requested) > models.MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail="Слишком много записей за раз")
+
+    parsed = []
+    errors = []
+    for item in requested:
+        try:
+            parsed.append(parse_booking(item))
+            errors.append(None)
+        except HTTPException as e:
+            parsed.append(None)
+            errors.append(e.detail)
+
+    all_or_nothing = mode == 'all_or_nothing'
+    outcomes = await storage.backend.book_batch(user_id, first_name, parsed, all_or_nothing)
+
+    success = all(isinstance(outcome, int) for outcome in outcomes)
+    committed = success or not all_or_nothing
+    results = []
+    for item, outcome, error in zip(requested, outcomes, errors):
+        result = {
+            "court_type": item.court_type,
+            "date": item.date,
+            "time_slot": item.time_slot,
+            "success": committed and isinstance(outcome, int)
+        }
+        if isinstance(outcome, int):
+            if committed:
+                result["booking_id"] = outcome
+            else:
+                result["detail"] = "Не сохранено: часть записей не удалась"
+        else:
+            result["detail"] = error or outcome
+        results.append(result)
+
+    await bookings_changed([
+        events.slot_change(result['date'], result['court_type'], result['time_slot'], user_id,
+                           first_name, result['booking_id'])
+        for result in results if result["success"]
+    ])
+
+    return {"success": success, "mode": mode, "results": results}
+
+@app.get("/api/my-bookings", response_model=List[models.BookingResponse])
+async def get_my_bookings(
+    request: Request,
+    response: Response,
+    limit: int = Query(storage.USER_BOOKINGS_LIMIT, ge=1, le=MAX_USER_BOOKINGS_LIMIT),
+    cursor: str = Query(None, pattern=models.CURSOR_PATTERN),
+    include_past: bool = Query(False),
+    user: dict = Depends(auth.current_user)
+):
+    # Записи с сегодняшнего дня (include_past - вся история, с архивом) страницами по limit.
+    # Если есть следующая страница, ссылка на нее - в заголовке Link (rel="next")
+    user_id = user['id']
+    # Список зависит и от текущей даты, поэтому она входит в ETag
+    today = schedule.today_number()
+    tag = f"user-{user_id}-{today}-{int(include_past)}-{limit}-{cursor or ''}"
+    not_modified = check_not_modified(request, response, database.db.versions.for_user(user_id), tag)
+    if not_modified:
+        return not_modified
+
+    after = tuple(int(part) for part in cursor.split('.')) if cursor else None
+    bookings, next_after = await storage.backend.user_bookings(user_id, today, include_past, after, limit)
+    if next_after is not None:
+        next_url = request.url.include_query_params(cursor='.'.join(map(str, next_after)))
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return bookings
+
+@app.delete("/api/booking/{booking_id}", response_model=models.MessageResponse)
+async def cancel_booking(booking_id: int, user: dict = Depends(auth.current_user)):
+    user_id = user['id']
+    booking, promoted = await storage.backend.cancel(booking_id, user_id)
+    await bookings_changed(events.cancel_changes(booking, user_id, promoted))
+    if promoted is None:
+        return {"success": True, "message": "Запись отменена"}
+
+    court = schedule.catalog().by_code.get(booking['court_type'])
+    notify.notifier.notify(
+        promoted['user_id'],
+        f"Освободилось место: {court.name if court else booking['court_type']}, "
+        f"{booking['date']} {booking['time_slot']}. Вы записаны из очереди."
     )
+    return {"success": True, "message": "Запись отменена"}
 
-    if cursor.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Запись не найдена")
-
-    conn.commit()
-    conn.close()
+@app.post("/api/waitlist")
+async def join_slot_waitlist(waitlist_data: models.WaitlistCreate, user: dict = Depends(auth.current_user)):
+    # Встать в очередь на занятый слот: при отмене он достанется первому в очереди автоматически
+    user_id = user['id']
+    ratelimit.book_limiter.check(f"user:{user_id}")
+    day, court_id, slot = parse_booking(waitlist_data)
+    entry = await storage.backend.join_waitlist(user_id, user.get('first_name', ''), day, court_id, slot)
+    return {"success": True, **entry}
+
+@app.get("/api/waitlist", response_model=List[models.WaitlistResponse])
+async def get_my_waitlist(user: dict = Depends(auth.current_user)):
+    return await storage.backend.user_waitlist(user['id'], schedule.today_number())
+
+@app.delete("/api/waitlist/{entry_id}", response_model=models.MessageResponse)
+async def leave_slot_waitlist(entry_id: int, user: dict = Depends(auth.current_user)):
+    await storage.backend.leave_waitlist(entry_id, user['id'])
+    return {"success": True, "message": "Вы вышли из очереди"}
+
+@app.get("/api/admin/bookings/export", dependencies=[Depends(auth.require_admin)])
+async def export_bookings(
+    date_from: str = Query(..., alias="from"),
+    date_to: str = Query(..., alias="to"),
+    format: str = Query("csv")
+):
+    # Выгрузка за любой период потоком: строки читаются из базы порциями по мере отправки
+    start = parse_day(date_from)
+    end = parse_day(date_to)
+    if end < start:
+        raise HTTPException(status_code=400, detail="Неверный период")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Неизвестный формат")
+
+    chunks = storage.backend.export_chunks(start, end)
+    if format == "csv":
+        body, media_type = bulk.stream_csv(chunks), "text/csv"
+    else:
+        body, media_type = bulk.stream_ndjson(chunks), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="bookings-{date_from}-{date_to}.{format}"'}
+    )
 
-    return {"success": True, "message": "Запись отменена"}
+@app.post("/api/admin/bookings/import", dependencies=[Depends(auth.require_admin)])
+async def import_bookings(request: Request, format: str = Query("csv"), mode: str = Query("all_or_nothing")):
+    # Импорт расписания из таблицы: одна транзакция, в ответе ошибки по номерам строк (с 1, без заголовка)
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Неизвестный формат")
+    if mode not in ('all_or_nothing', 'best_effort'):
+        raise HTTPException(status_code=400, detail="Неизвестный режим")
+
+    try:
+        rows = bulk.read_import_rows(await request.body(), format)
+    except (UnicodeDecodeError, csv.Error):
+        raise HTTPException(status_code=400, detail="Не удалось прочитать файл")
+    if not rows:
+        raise HTTPException(status_code=400, detail="Нет записей")
+    if len(rows) > bulk.MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=400, detail="Слишком много записей за раз")
+
+    catalog = schedule.catalog()
+    parsed = [bulk.parse_import_row(row, catalog) for row in rows]
+    items = [item if isinstance(item, tuple) else None for item in parsed]
+    all_or_nothing = mode == 'all_or_nothing'
+    outcomes = await storage.backend.import_bookings(items, all_or_nothing)
+
+    errors = [
+        {"row": number, "detail": outcome or error}
+        for number, (error, outcome) in enumerate(zip(parsed, outcomes), 1)
+        if not isinstance(outcome, int)
+    ]
+    success = not errors
+    imported = sum(isinstance(outcome, int) for outcome in outcomes) if success or not all_or_nothing else 0
+    if imported:
+        # Затронуты могут быть любые дни и пользователи - сбрасываем кэш и ETag во всех воркерах целиком
+        await hub.publish({"reset": True})
+    return {"success": success, "mode": mode, "imported": imported, "errors": errors}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # С несколькими воркерами uvicorn нужно передать приложение строкой импорта
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv('PORT', '8000')), workers=workers)
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LOOP_LAG_INTERVAL = 0.1
+
+# Медленные запросы: порог в миллисекундах и доля, которая попадет в лог
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_SAMPLE = float(os.getenv('SLOW_QUERY_SAMPLE', '1.0'))
+
+@lru_cache(maxsize=512)
+def sql_shape(sql):
+    # Форма запроса: без лишних пробелов и литералов, чтобы группировать одинаковые запросы
+    shape = re.sub(r"'[^']*'", '?', sql)
+    shape = re.sub(r'\b\d+\b', '?', shape)
+    shape = ' '.join(shape.split())
+    return shape[:200]
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+class Metrics:
+    # Реестр метрик процесса; пишется из event loop и из потоков пула базы
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # Хуки для Database
+    def query(self, sql, seconds):
+        shape = sql_shape(sql)
+        self.observe('db_query_duration_seconds', seconds, (('query', shape),))
+        if seconds * 1000 >= SLOW_QUERY_MS and random.random() < SLOW_QUERY_SAMPLE:
+            logger.warning("Slow query %.1f ms: %s", seconds * 1000, shape)
+
+    def call(self, operation, wait_seconds, seconds):
+        self.observe('db_pool_wait_seconds', wait_seconds)
+        self.observe('db_call_duration_seconds', seconds, (('operation', operation),))
+
+    def connection_opened(self):
+        self.inc('db_connections_opened_total')
+
+    def connection_closed(self):
+        self.inc('db_connections_closed_total')
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.buckets, list(h.counts), h.count, h.sum) for key, h in self._histograms.items()}
+
+        lines = []
+        described = set()
+
+        def header(name):
+            if name in described or name not in self._help:
+                return
+            kind, text = self._help[name]
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            described.add(name)
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name)
+            lines.append(f'{name}{format_labels(labels)} {value}')
+
+        for (name, labels), (buckets, counts, count, total) in sorted(histograms.items()):
+            header(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    # ASGI-middleware: время ответа по шаблону маршрута, а не по конкретному URL
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', 'unmatched')
+            labels = (('method', scope['method']), ('route', path))
+            self.metrics.observe('http_request_duration_seconds', time.perf_counter() - started, labels)
+            self.metrics.inc('http_requests_total', labels + (('status', status),))
+
+async def watch_event_loop(metrics, interval=LOOP_LAG_INTERVAL):
+    # Насколько позже запланированного просыпается loop - столько он был заблокирован
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - started - interval
+        metrics.observe('event_loop_lag_seconds', max(lag, 0.0))
+
+registry = Metrics()
+registry.describe('http_requests_total', 'counter', 'HTTP requests by route and status')
+registry.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency by route')
+registry.describe('db_query_duration_seconds', 'histogram', 'SQL statement execution time by query shape')
+registry.describe('db_call_duration_seconds', 'histogram', 'Time spent in a database operation on a pool thread')
+registry.describe('db_pool_wait_seconds', 'histogram', 'Time a database operation waited for a pool thread')
+registry.describe('db_connections_opened_total', 'counter', 'SQLite connections opened')
+registry.describe('db_connections_closed_total', 'counter', 'SQLite connections closed')
+registry.describe('event_loop_lag_seconds', 'histogram', 'Event loop scheduling delay')
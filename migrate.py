@@ -0,0 +1,38 @@
+# Перевод базы со старой схемы bookings (строки court_type/date/time_slot) на компактную.
+# Пример: python migrate.py /data/tennis_booking.db --batch-size 1000 --drop-legacy --vacuum
+import argparse
+import json
+import logging
+import sqlite3
+
+import database
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Миграция bookings на компактную схему')
+    parser.add_argument('db_path', nargs='?', default=database.DB_PATH, help='путь к базе')
+    parser.add_argument('--batch-size', type=int, default=1000, help='строк за одну транзакцию')
+    parser.add_argument('--drop-legacy', action='store_true', help='удалить старую таблицу после миграции')
+    parser.add_argument('--vacuum', action='store_true', help='сжать файл базы после миграции')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    if not database.is_legacy_bookings(conn):
+        print(json.dumps({'migrated': False, 'reason': 'schema is already compact'}))
+    else:
+        conn.close()
+        # Справочники и счетчик создаются так же, как при старте приложения
+        db = database.Database(db_path=args.db_path, auto_migrate=False)
+        db.initialize()
+        conn = db.get_connection()
+        report = database.migrate_bookings(conn, batch_size=args.batch_size, drop_legacy=args.drop_legacy)
+        print(json.dumps({'migrated': True, 'copied': report['copied'],
+                          'batches': report['batches'], 'skipped': report['skipped']}))
+
+    if args.vacuum:
+        conn.execute('VACUUM')
+    conn.close()
@@ -1,13 +1,55 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import date
+from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
 
-class BookingCreate(BaseModel):
-    user_id: int
-    first_name: str
-    court_type: str
-    date: str
-    time_slot: str
+# Формат полей проверяется при разборе запроса (ошибка - 422). Есть ли такой корт и слот,
+# проверяет parse_booking по текущему каталогу (400): каталог меняется без перезапуска
+COURT_PATTERN = r'^[a-z0-9_-]{1,32}$'
+DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+MONTH_PATTERN = r'^\d{4}-\d{2}$'
+# Курсор страницы списка записей: "day.slot.id" последней записи предыдущей страницы.
+# Не больше 18 цифр в каждой части - значение всегда помещается в 64-битный INTEGER SQLite
+CURSOR_PATTERN = r'^-?\d{1,10}\.\d{1,5}\.\d{1,18}$'
+TIME_SLOT_PATTERN = r'^\d{2}:\d{2}-\d{2}:\d{2}$'
+MAX_BATCH_ITEMS = 60
+
+class SlotRequest(BaseModel):
+    court_type: str = Field(pattern=COURT_PATTERN)
+    date: str = Field(pattern=DATE_PATTERN)
+    time_slot: str = Field(pattern=TIME_SLOT_PATTERN)
+
+    @field_validator('date')
+    @classmethod
+    def check_date(cls, value):
+        datetime.strptime(value, '%Y-%m-%d')
+        return value
+
+class BookingCreate(SlotRequest):
+    # Пользователь берется из initData; user_id и first_name, которые шлют старые клиенты, игнорируются
+    pass
+
+class WaitlistCreate(SlotRequest):
+    pass
+
+class Recurrence(BaseModel):
+    # Тот же корт и время каждые interval_weeks недель, count раз начиная с start_date
+    court_type: str = Field(pattern=COURT_PATTERN)
+    start_date: str = Field(pattern=DATE_PATTERN)
+    time_slot: str = Field(pattern=TIME_SLOT_PATTERN)
+    count: int = Field(1, ge=1, le=MAX_BATCH_ITEMS)
+    interval_weeks: int = Field(1, ge=1, le=52)
+
+    @field_validator('start_date')
+    @classmethod
+    def check_date(cls, value):
+        datetime.strptime(value, '%Y-%m-%d')
+        return value
+
+class BatchCreate(BaseModel):
+    # Список слотов или правило повторения; если есть оба, используется правило
+    mode: Literal['all_or_nothing', 'best_effort'] = 'all_or_nothing'
+    items: Optional[List[SlotRequest]] = None
+    recurrence: Optional[Recurrence] = None
 
 class SlotResponse(BaseModel):
     court_type: str
@@ -15,9 +57,30 @@ class SlotResponse(BaseModel):
     time_slot: str
     is_available: bool
     booked_by: Optional[str] = None
+    booking_id: Optional[int] = None
 
 class BookingResponse(BaseModel):
     id: int
     court_type: str
     date: str
-    time_slot: str
\ No newline at end of file
+    time_slot: str
+
+class WaitlistResponse(BookingResponse):
+    position: int
+
+class BatchItemResult(BaseModel):
+    court_type: str
+    date: str
+    time_slot: str
+    success: bool
+    booking_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    success: bool
+    mode: str
+    results: List[BatchItemResult]
+
+class MessageResponse(BaseModel):
+    success: bool
+    message: str
@@ -0,0 +1,43 @@
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+BOT_API_URL = 'https://api.telegram.org'
+NOTIFY_TIMEOUT = 5
+
+class TelegramNotifier:
+    # Сообщения пользователю от бота. Отправка идет фоновой задачей, чтобы запрос
+    # не ждал Telegram; без BOT_TOKEN сообщение только пишется в лог
+    def __init__(self, bot_token):
+        self.bot_token = bot_token
+        self._tasks = set()
+
+    def notify(self, user_id, text):
+        task = asyncio.create_task(self.send(user_id, text))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def send(self, user_id, text):
+        if not self.bot_token:
+            logger.info("Notification for %s: %s", user_id, text)
+            return
+        try:
+            await asyncio.to_thread(self._post, user_id, text)
+        except Exception:
+            logger.exception("Notification for %s failed", user_id)
+
+    def _post(self, user_id, text):
+        # urllib.request импортируется только при первой отправке - он заметно удлиняет старт
+        import urllib.request
+        request = urllib.request.Request(
+            f"{BOT_API_URL}/bot{self.bot_token}/sendMessage",
+            data=json.dumps({"chat_id": user_id, "text": text}).encode(),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=NOTIFY_TIMEOUT) as response:
+            response.read()
+
+notifier = TelegramNotifier(os.getenv('BOT_TOKEN'))
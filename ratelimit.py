@@ -0,0 +1,59 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from fastapi import HTTPException
+
+# Лимиты на воркер: запросов в секунду и размер "всплеска"
+SLOTS_RATE = float(os.getenv('SLOTS_RATE', '5'))
+SLOTS_BURST = float(os.getenv('SLOTS_BURST', '30'))
+BOOK_RATE = float(os.getenv('BOOK_RATE', '0.5'))
+BOOK_BURST = float(os.getenv('BOOK_BURST', '10'))
+# TRUST_PROXY=1 - приложение стоит за прокси платформы, и адрес клиента берется из X-Forwarded-For.
+# Без прокси заголовок задает сам клиент, поэтому по умолчанию он не читается
+TRUST_PROXY = os.getenv('TRUST_PROXY') == '1'
+
+class TokenBucketLimiter:
+    # Корзина токенов на ключ (пользователь или IP); старые ключи вытесняются по LRU
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def acquire(self, key):
+        # Возвращает 0, если запрос разрешен, иначе сколько секунд подождать
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def check(self, *keys):
+        for key in keys:
+            wait = self.acquire(key)
+            if wait:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Слишком много запросов, попробуйте позже",
+                    headers={"Retry-After": str(math.ceil(wait))}
+                )
+
+def client_ip(request):
+    # За прокси платформы реальный адрес - последний в X-Forwarded-For
+    forwarded = request.headers.get('x-forwarded-for') if TRUST_PROXY else None
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return request.client.host if request.client else 'unknown'
+
+slots_limiter = TokenBucketLimiter(SLOTS_RATE, SLOTS_BURST)
+book_limiter = TokenBucketLimiter(BOOK_RATE, BOOK_BURST)
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import date, datetime
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Каталог кортов: JSON-файл рядом с приложением или путь из COURTS_CONFIG
+CATALOG_PATH = os.getenv(
+    'COURTS_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'courts.json')
+)
+CATALOG_RELOAD_INTERVAL = 5
+
+# Если файла нет - работаем с двумя кортами, как раньше
+DEFAULT_CONFIG = {
+    "courts": [
+        {"id": 1, "code": "rubber", "name": "Резиновый", "opens": "06:00", "closes": "24:00", "slot_minutes": 60},
+        {"id": 2, "code": "hard", "name": "Хард", "opens": "06:00", "closes": "24:00", "slot_minutes": 60},
+    ],
+    "blackout_dates": []
+}
+
+# День хранится числом дней от 1970-01-01
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def day_number(value):
+    # ValueError, если дата не в формате YYYY-MM-DD
+    return datetime.strptime(value, "%Y-%m-%d").date().toordinal() - EPOCH_ORDINAL
+
+def day_string(number):
+    return date.fromordinal(number + EPOCH_ORDINAL).isoformat()
+
+def today_number():
+    return date.today().toordinal() - EPOCH_ORDINAL
+
+def parse_time(value):
+    hours, minutes = value.split(':')
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= total <= 24 * 60:
+        raise ValueError(f"Invalid time {value}")
+    return total
+
+def format_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def generate_time_slots(opens=6 * 60, closes=24 * 60, slot_minutes=60):
+    slots = []
+    for start in range(opens, closes - slot_minutes + 1, slot_minutes):
+        slots.append(f"{format_time(start)}-{format_time(start + slot_minutes)}")
+    return slots
+
+class Court:
+    # Слот в базе хранится минутой начала от полуночи, position - его номер в сетке корта
+    def __init__(self, config, global_blackout):
+        self.id = int(config['id'])
+        self.code = config['code']
+        self.name = config.get('name', self.code)
+        self.opens = parse_time(config.get('opens', '06:00'))
+        self.closes = parse_time(config.get('closes', '24:00'))
+        self.slot_minutes = int(config.get('slot_minutes', 60))
+        if self.slot_minutes <= 0 or self.opens + self.slot_minutes > self.closes:
+            raise ValueError(f"Court {self.code}: empty slot grid")
+
+        self.time_slots = tuple(generate_time_slots(self.opens, self.closes, self.slot_minutes))
+        self.starts = tuple(range(self.opens, self.closes - self.slot_minutes + 1, self.slot_minutes))
+        self.slot_index = MappingProxyType(dict(zip(self.time_slots, self.starts)))
+        self.slot_names = MappingProxyType(dict(zip(self.starts, self.time_slots)))
+        self.positions = MappingProxyType({start: i for i, start in enumerate(self.starts)})
+        self.full_mask = (1 << len(self.starts)) - 1
+        self.blackout = frozenset(
+            global_blackout | {day_number(value) for value in config.get('blackout_dates', [])}
+        )
+
+    def slot_name(self, start):
+        # Слот мог пропасть из сетки после смены часов работы - показываем его как есть
+        return self.slot_names.get(start) or f"{format_time(start)}-{format_time(start + self.slot_minutes)}"
+
+    def describe(self):
+        return {
+            "code": self.code,
+            "name": self.name,
+            "time_slots": list(self.time_slots),
+            "blackout_dates": sorted(day_string(day) for day in self.blackout)
+        }
+
+class Catalog:
+    # Неизменяемый снимок каталога; при перезагрузке создается новый объект целиком
+    def __init__(self, config, version):
+        global_blackout = {day_number(value) for value in config.get('blackout_dates', [])}
+        courts = tuple(Court(court, global_blackout) for court in config['courts'])
+        if not courts:
+            raise ValueError("Catalog has no courts")
+
+        self.version = version
+        self.courts = courts
+        self.by_code = MappingProxyType({court.code: court for court in courts})
+        self.by_id = MappingProxyType({court.id: court for court in courts})
+        if len(self.by_code) != len(courts) or len(self.by_id) != len(courts):
+            raise ValueError("Court ids and codes must be unique")
+        self.court_types = tuple(court.code for court in courts)
+
+    def court_code(self, court_id):
+        court = self.by_id.get(court_id)
+        return court.code if court else f"court-{court_id}"
+
+    def slot_name(self, court_id, start):
+        court = self.by_id.get(court_id)
+        if court is None:
+            return f"{format_time(start)}-{format_time(start + 60)}"
+        return court.slot_name(start)
+
+_catalog = None
+_catalog_mtime = None
+
+def read_config(path):
+    if not os.path.exists(path):
+        return DEFAULT_CONFIG, None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f), os.path.getmtime(path)
+
+def build_catalog(config):
+    version = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+    return Catalog(config, version)
+
+def reload_catalog(path=None):
+    # Перечитывает файл, если он изменился. Ошибка в файле не ломает работающий каталог
+    global _catalog, _catalog_mtime
+    path = path or CATALOG_PATH
+
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if _catalog is not None and mtime == _catalog_mtime:
+        return False
+
+    try:
+        config, mtime = read_config(path)
+        new_catalog = build_catalog(config)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if _catalog is None:
+            raise
+        logger.error("Court catalog %s not reloaded: %s", path, e)
+        _catalog_mtime = mtime
+        return False
+
+    changed = _catalog is None or new_catalog.version != _catalog.version
+    _catalog, _catalog_mtime = new_catalog, mtime
+    if changed:
+        logger.info("Court catalog %s loaded: %s", new_catalog.version, ', '.join(new_catalog.court_types))
+    return changed
+
+def catalog():
+    if _catalog is None:
+        reload_catalog()
+    return _catalog
+
+async def watch_catalog(on_change, interval=CATALOG_RELOAD_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        if reload_catalog():
+            await on_change(_catalog)
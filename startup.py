@@ -0,0 +1,66 @@
+# Профиль импорта приложения: сколько стоит "import main" и какие модули дольше всего грузятся.
+# Пример: python startup.py --top 15 --budget-ms 800
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Профиль времени импорта приложения')
+    parser.add_argument('--module', default='main', help='импортируемый модуль')
+    parser.add_argument('--top', type=int, default=20, help='сколько самых долгих модулей показать')
+    parser.add_argument('--runs', type=int, default=3, help='сколько раз повторить, берется лучший')
+    parser.add_argument('--budget-ms', type=float, help='код выхода 1, если импорт дольше')
+    return parser.parse_args()
+
+def import_profile(module):
+    # -X importtime пишет в stderr строки "import time: self | cumulative | name" в микросекундах.
+    # База указывает во временный каталог: импорт не должен ее трогать, и это проверяется ниже
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        env = {**os.environ, 'DB_PATH': db_path, 'PYTHONDONTWRITEBYTECODE': '1'}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=APP_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise SystemExit(result.stderr)
+        touched_db = os.path.exists(db_path)
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'self_ms': int(own) / 1000, 'cumulative_ms': int(cumulative) / 1000})
+    return modules, touched_db
+
+def local_modules():
+    return {name[:-3] for name in os.listdir(APP_DIR) if name.endswith('.py')}
+
+if __name__ == '__main__':
+    args = parse_args()
+    runs = [import_profile(args.module) for _ in range(args.runs)]
+    modules, touched_db = min(runs, key=lambda run: sum(item['self_ms'] for item in run[0]))
+
+    total_ms = sum(item['self_ms'] for item in modules)
+    app = local_modules()
+    report = {
+        'module': args.module,
+        'total_ms': round(total_ms, 1),
+        'modules': len(modules),
+        'touches_database': touched_db,
+        'app_modules': sorted(
+            ({'module': item['module'], 'self_ms': item['self_ms']} for item in modules if item['module'] in app),
+            key=lambda item: -item['self_ms']
+        ),
+        'slowest': sorted(modules, key=lambda item: -item['cumulative_ms'])[:args.top],
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if touched_db or (args.budget_ms is not None and total_ms > args.budget_ms):
+        sys.exit(1)
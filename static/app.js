@@ -0,0 +1,437 @@
+let currentCourt = 'rubber';
+let courtNames = {};
+let currentUser = null;
+let initData = '';
+let isInitialized = false;
+let slotStream = null;
+let slotStreamKey = null;
+// Элементы отрисованной сетки по time_slot; события, пришедшие пока сетка загружается, ждут в pendingSlotEvents
+let slotElements = {};
+let pendingSlotEvents = null;
+
+function showLoading() {
+    document.getElementById('loading').style.display = 'block';
+    document.getElementById('content').style.display = 'none';
+}
+
+function hideLoading() {
+    document.getElementById('loading').style.display = 'none';
+    document.getElementById('content').style.display = 'block';
+}
+
+function showError(message) {
+    const errorDiv = document.getElementById('error-message');
+    errorDiv.textContent = message;
+    errorDiv.style.display = 'block';
+    setTimeout(() => errorDiv.style.display = 'none', 5000);
+}
+
+async function initTelegramUser() {
+    console.log('=== INIT TELEGRAM USER ===');
+
+    try {
+        // Внутри Telegram берем подписанный initData - сервер проверяет его подпись
+        if (window.Telegram && window.Telegram.WebApp && window.Telegram.WebApp.initData) {
+            console.log('✅ Telegram WebApp detected');
+            const tg = window.Telegram.WebApp;
+            tg.ready();
+
+            const user = tg.initDataUnsafe.user;
+            console.log('👤 User from Telegram:', user);
+            initData = tg.initData;
+            currentUser = {
+                id: user.id,
+                first_name: user.first_name || 'Telegram User',
+                username: user.username || '',
+                last_name: user.last_name || '',
+                language_code: user.language_code || 'ru'
+            };
+            showUserInfo(currentUser);
+            return true;
+        }
+
+        // Вне Telegram - гость; без подписи сервер примет его только при локальном запуске с AUTH_INSECURE=1
+        const savedUser = localStorage.getItem('telegramUser');
+        if (savedUser) {
+            currentUser = JSON.parse(savedUser);
+            console.log('📁 User from localStorage:', currentUser);
+        } else {
+            console.log('👤 Creating guest user');
+            currentUser = {
+                id: Math.floor(Math.random() * 1000000),
+                first_name: 'Гость'
+            };
+            localStorage.setItem('telegramUser', JSON.stringify(currentUser));
+        }
+        initData = 'user=' + encodeURIComponent(JSON.stringify(currentUser));
+        showUserInfo(currentUser);
+        return true;
+
+    } catch (error) {
+        console.error('Error initializing user:', error);
+        // В случае ошибки всё равно создаем гостя
+        currentUser = {
+            id: Math.floor(Math.random() * 1000000),
+            first_name: 'Гость'
+        };
+        initData = 'user=' + encodeURIComponent(JSON.stringify(currentUser));
+        showUserInfo(currentUser);
+        return true;
+    }
+}
+
+function authHeaders(headers = {}) {
+    return { ...headers, 'Authorization': 'tma ' + initData };
+}
+
+function showUserInfo(user) {
+    try {
+        const userName = user.first_name + (user.last_name ? ' ' + user.last_name : '');
+        document.getElementById('user-name').textContent = userName;
+        document.getElementById('user-info').style.display = 'block';
+        console.log(`👤 User: ${userName}`);
+    } catch (error) {
+        console.error('Error showing user info:', error);
+    }
+}
+
+function resetUser() {
+    localStorage.removeItem('telegramUser');
+    currentUser = null;
+    document.getElementById('user-info').style.display = 'none';
+    setTimeout(() => location.reload(), 100);
+}
+
+async function initializeApp() {
+    showLoading();
+    console.log('🚀 Initializing app...');
+
+    try {
+        // Инициализируем пользователя
+        await initTelegramUser();
+
+        // Загружаем список кортов
+        await loadCourts();
+
+        // Устанавливаем сегодняшнюю дату
+        document.getElementById('date-picker').value = new Date().toISOString().split('T')[0];
+
+        // Загружаем слоты
+        await loadSlots();
+
+        // Показываем интерфейс
+        hideLoading();
+        isInitialized = true;
+        console.log('✅ App initialized successfully');
+
+    } catch (error) {
+        console.error('❌ App initialization failed:', error);
+        hideLoading();
+        showError('Ошибка загрузки. Пожалуйста, обновите страницу.');
+    }
+}
+
+function showTab(tabName) {
+    if (!isInitialized) return;
+
+    document.querySelectorAll('.tab').forEach(tab => tab.classList.remove('active'));
+    event.target.classList.add('active');
+
+    document.getElementById('booking-tab').style.display = 'none';
+    document.getElementById('my-bookings-tab').style.display = 'none';
+    document.getElementById(tabName + '-tab').style.display = 'block';
+
+    if (tabName === 'my-bookings') {
+        loadMyBookings();
+    }
+}
+
+async function loadCourts() {
+    const response = await fetch('/api/courts');
+    if (!response.ok) throw new Error('Network error');
+
+    const catalog = await response.json();
+    const container = document.getElementById('court-buttons');
+    container.innerHTML = '';
+    courtNames = {};
+
+    if (!catalog.courts.some(court => court.code === currentCourt)) {
+        currentCourt = catalog.courts[0].code;
+    }
+
+    catalog.courts.forEach(court => {
+        courtNames[court.code] = court.name;
+        const button = document.createElement('button');
+        button.id = 'court-' + court.code;
+        button.className = 'court-button' + (court.code === currentCourt ? ' active' : '');
+        button.textContent = court.name;
+        button.onclick = () => selectCourt(court.code);
+        container.appendChild(button);
+    });
+}
+
+function selectCourt(court) {
+    if (!isInitialized) return;
+
+    currentCourt = court;
+    document.querySelectorAll('.court-button').forEach(button => button.classList.remove('active'));
+    document.getElementById('court-' + court).classList.add('active');
+    loadSlots();
+}
+
+async function loadSlots() {
+    if (!isInitialized) return;
+
+    const date = document.getElementById('date-picker').value;
+    if (!date) return;
+
+    subscribeSlots(date, currentCourt);
+    pendingSlotEvents = [];
+
+    try {
+        const response = await fetch('/api/slots?date=' + date);
+        if (!response.ok) throw new Error('Network error');
+
+        const slots = await response.json();
+
+        const container = document.getElementById('slots-container');
+        container.innerHTML = '<h3>Доступные слоты:</h3>';
+
+        const grid = document.createElement('div');
+        grid.className = 'slots-grid';
+
+        const courtSlots = slots
+            .filter(slot => slot.court_type === currentCourt)
+            .sort((a, b) => a.time_slot.localeCompare(b.time_slot));
+
+        slotElements = {};
+        courtSlots.forEach(slot => {
+            const slotElement = document.createElement('div');
+            renderSlot(slotElement, slot);
+            slotElements[slot.time_slot] = slotElement;
+            grid.appendChild(slotElement);
+        });
+
+        container.appendChild(grid);
+    } catch (error) {
+        console.error('Error loading slots:', error);
+        showError('Ошибка загрузки расписания');
+    }
+
+    const pending = pendingSlotEvents || [];
+    pendingSlotEvents = null;
+    pending.forEach(applySlotEvent);
+}
+
+function renderSlot(slotElement, slot) {
+    slotElement.className = 'slot ' + (slot.is_available ? 'available' : 'booked');
+    slotElement.innerHTML = slot.time_slot.replace('-', '<br>') + 
+        (slot.is_available ? '<br><small>Свободно</small>' : '<br><small>Занято: ' + slot.booked_by + '</small>');
+
+    if (slot.is_available) {
+        slotElement.onclick = () => bookSlot(slot);
+    } else {
+        slotElement.onclick = () => joinWaitlist(slot);
+    }
+}
+
+function applySlotEvent(slot) {
+    // Событие несет новое состояние одного слота - перерисовываем только его, без запроса сетки
+    if (pendingSlotEvents) {
+        pendingSlotEvents.push(slot);
+        return;
+    }
+    if (slot.date !== document.getElementById('date-picker').value || slot.court_type !== currentCourt) return;
+
+    const slotElement = slotElements[slot.time_slot];
+    if (slotElement) {
+        renderSlot(slotElement, slot);
+    } else {
+        // Такого слота нет в сетке - сменился каталог кортов
+        loadSlots();
+    }
+}
+
+function subscribeSlots(date, court) {
+    // Живые обновления сетки вместо периодического опроса
+    const key = date + '/' + court;
+    if (!window.EventSource || slotStreamKey === key) return;
+
+    if (slotStream) slotStream.close();
+    slotStreamKey = key;
+    slotStream = new EventSource('/api/slots/stream?date=' + date + '&court=' + court);
+    slotStream.addEventListener('slot', event => applySlotEvent(JSON.parse(event.data)));
+
+    // Пока соединения не было, события могли потеряться - после переподключения перечитываем сетку один раз
+    let reconnecting = false;
+    slotStream.addEventListener('error', () => { reconnecting = true; });
+    slotStream.addEventListener('open', () => {
+        if (reconnecting) {
+            reconnecting = false;
+            loadSlots();
+        }
+    });
+}
+
+async function bookSlot(slot) {
+    if (!currentUser || !isInitialized) {
+        alert('Приложение не готово');
+        return;
+    }
+
+    if (!confirm('Записаться на ' + slot.time_slot + '?')) return;
+
+    try {
+        const response = await fetch('/api/book', {
+            method: 'POST',
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify({
+                court_type: slot.court_type,
+                date: slot.date,
+                time_slot: slot.time_slot
+            })
+        });
+
+        const result = await response.json();
+        if (result.success) {
+            alert('Успешно записаны!');
+            loadSlots();
+        } else {
+            alert('Ошибка: ' + result.detail);
+        }
+    } catch (error) {
+        console.error('Error booking slot:', error);
+        alert('Ошибка при записи');
+    }
+}
+
+async function joinWaitlist(slot) {
+    if (!currentUser || !isInitialized) {
+        alert('Приложение не готово');
+        return;
+    }
+
+    // Вместо ожидания отмены вручную - очередь: слот запишется на вас сам, бот пришлет сообщение
+    if (!confirm('Слот занят. Встать в очередь на ' + slot.time_slot + '?')) return;
+
+    try {
+        const response = await fetch('/api/waitlist', {
+            method: 'POST',
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify({
+                court_type: slot.court_type,
+                date: slot.date,
+                time_slot: slot.time_slot
+            })
+        });
+
+        const result = await response.json();
+        if (result.success) {
+            alert('Вы в очереди, место: ' + result.position);
+        } else {
+            alert('Ошибка: ' + result.detail);
+        }
+    } catch (error) {
+        console.error('Error joining waitlist:', error);
+        alert('Ошибка при постановке в очередь');
+    }
+}
+
+async function loadMyBookings() {
+    if (!currentUser || !isInitialized) {
+        alert('Приложение не готово');
+        return;
+    }
+
+    try {
+        const [bookingsResponse, waitlistResponse] = await Promise.all([
+            fetch('/api/my-bookings', { headers: authHeaders() }),
+            fetch('/api/waitlist', { headers: authHeaders() })
+        ]);
+        const bookings = await bookingsResponse.json();
+        const waitlist = await waitlistResponse.json();
+
+        const container = document.getElementById('bookings-list');
+        container.innerHTML = '';
+
+        if (bookings.length === 0 && waitlist.length === 0) {
+            container.innerHTML = '<p>У вас нет активных записей</p>';
+            return;
+        }
+
+        bookings.forEach(booking => {
+            const bookingElement = document.createElement('div');
+            bookingElement.className = 'court';
+            bookingElement.innerHTML = `
+                <strong>${booking.date}</strong> ${booking.time_slot.replace('-', ' - ')} 
+                (${courtNames[booking.court_type] || booking.court_type})
+                <button onclick="cancelBooking(${booking.id})" style="margin-left: 10px;">Отменить</button>
+            `;
+            container.appendChild(bookingElement);
+        });
+
+        waitlist.forEach(entry => {
+            const entryElement = document.createElement('div');
+            entryElement.className = 'court';
+            entryElement.innerHTML = `
+                <strong>${entry.date}</strong> ${entry.time_slot.replace('-', ' - ')} 
+                (${courtNames[entry.court_type] || entry.court_type}) - в очереди, место ${entry.position}
+                <button onclick="leaveWaitlist(${entry.id})" style="margin-left: 10px;">Выйти</button>
+            `;
+            container.appendChild(entryElement);
+        });
+    } catch (error) {
+        console.error('Error loading bookings:', error);
+        showError('Ошибка загрузки записей');
+    }
+}
+
+async function cancelBooking(bookingId) {
+    if (!confirm('Отменить запись?')) return;
+
+    try {
+        const response = await fetch('/api/booking/' + bookingId, {
+            method: 'DELETE',
+            headers: authHeaders()
+        });
+
+        const result = await response.json();
+        alert(result.message);
+        loadMyBookings();
+    } catch (error) {
+        console.error('Error canceling booking:', error);
+        alert('Ошибка при отмене записи');
+    }
+}
+
+async function leaveWaitlist(entryId) {
+    try {
+        const response = await fetch('/api/waitlist/' + entryId, {
+            method: 'DELETE',
+            headers: authHeaders()
+        });
+
+        const result = await response.json();
+        alert(result.message || result.detail);
+        loadMyBookings();
+    } catch (error) {
+        console.error('Error leaving waitlist:', error);
+        alert('Ошибка при выходе из очереди');
+    }
+}
+
+// Инициализация при загрузке
+document.addEventListener('DOMContentLoaded', function() {
+    console.log('📄 DOM loaded');
+    setTimeout(() => {
+        initializeApp();
+    }, 100);
+});
+
+// Резервная инициализация на случай если что-то пошло не так
+setTimeout(() => {
+    if (!isInitialized) {
+        console.log('🕒 Backup initialization');
+        initializeApp();
+    }
+}, 5000);
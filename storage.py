@@ -0,0 +1,598 @@
+import logging
+import os
+import sqlite3
+from fastapi import HTTPException
+
+import analytics
+import bulk
+import events
+import schedule
+import writer
+
+logger = logging.getLogger(__name__)
+
+# sqlite - все запросы в базу (по умолчанию), replica - запись в SQLite, чтение дней из копии в памяти,
+# memory - только память процесса, для тестов и бенчмарков
+STORAGE = os.getenv('STORAGE', 'sqlite')
+# Сколько дней вперед копия в памяти загружает при старте
+REPLICA_WARM_DAYS = 62
+MAX_WAITLIST_SIZE = 20
+# Список записей пользователя отдается страницами по ключу (day, slot, id)
+USER_BOOKINGS_LIMIT = 100
+# Ключ "до любой записи" для include_past
+FIRST_KEY = (-(1 << 31), -1, -1)
+
+# Функции ниже выполняются в пуле database.db.run(), вне event loop
+def fetch_day_bookings(conn, day):
+    cursor = conn.cursor()
+
+    # Одним запросом забираем все записи на день
+    cursor.execute('''
+        SELECT b.id, b.court_id, b.slot, u.first_name
+        FROM bookings b
+        LEFT JOIN users u ON b.user_id = u.user_id
+        WHERE b.day = ?
+    ''', (day,))
+    return cursor.fetchall()
+
+def fetch_range_bookings(conn, day_from, day_to, court_id):
+    cursor = conn.cursor()
+
+    query = 'SELECT court_id, day, slot FROM bookings WHERE day BETWEEN ? AND ?'
+    params = [day_from, day_to]
+    if court_id:
+        query += ' AND court_id = ?'
+        params.append(court_id)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+# Конфликты по UNIQUE-ограничениям bookings -> текст ошибки для пользователя
+BOOKING_CONFLICTS = {
+    'bookings.user_id, bookings.day': "Вы уже записаны на этот день",
+    'bookings.day, bookings.court_id, bookings.slot': "Это время уже занято",
+}
+
+def booking_conflict(error):
+    for columns, detail in BOOKING_CONFLICTS.items():
+        if str(error).endswith(columns):
+            return detail
+    return None
+
+def insert_booking_row(cursor, user_id, day, court_id, slot):
+    # Вызывается внутри уже открытой транзакции; конфликт - sqlite3.IntegrityError
+    cursor.execute("UPDATE sequences SET value = value + 1 WHERE name = 'bookings'")
+    booking_id = cursor.execute("SELECT value FROM sequences WHERE name = 'bookings'").fetchone()[0]
+    cursor.execute(
+        'INSERT INTO bookings (id, user_id, court_id, day, slot) VALUES (?, ?, ?, ?, ?)',
+        (booking_id, user_id, court_id, day, slot)
+    )
+    analytics.record_bookings(cursor, [(day, court_id, slot, 1, 0)])
+    return booking_id
+
+def book_row(cursor, user_id, first_name, day, court_id, slot):
+    # Запись пользователя внутри открытой транзакции: проверки делают сами UNIQUE-ограничения,
+    # а не отдельные SELECT. Конфликт - HTTPException, откат делает вызывающий
+    cursor.execute(
+        'INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
+        (user_id, first_name)
+    )
+    try:
+        booking_id = insert_booking_row(cursor, user_id, day, court_id, slot)
+    except sqlite3.IntegrityError as e:
+        detail = booking_conflict(e)
+        if detail:
+            raise HTTPException(status_code=400, detail=detail)
+        raise
+    events.write_outbox(cursor, [
+        events.slot_change(*slot_names(day, court_id, slot), user_id, first_name, booking_id)
+    ])
+    return booking_id
+
+def insert_booking(conn, user_id, first_name, day, court_id, slot):
+    # При ошибке транзакцию откатывает database.db.run
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    booking_id = book_row(cursor, user_id, first_name, day, court_id, slot)
+    conn.commit()
+    return booking_id
+
+def insert_booking_batch(conn, user_id, first_name, items, all_or_nothing):
+    # items: список (day, court_id, slot) или None для строк, не прошедших проверку.
+    # Каждая запись под своим SAVEPOINT, чтобы конфликт откатывал только ее
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute(
+        'INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
+        (user_id, first_name)
+    )
+
+    results = []
+    for item in items:
+        if item is None:
+            results.append(None)
+            continue
+        cursor.execute('SAVEPOINT booking_item')
+        try:
+            results.append(insert_booking_row(cursor, user_id, *item))
+        except sqlite3.IntegrityError as e:
+            cursor.execute('ROLLBACK TO booking_item')
+            detail = booking_conflict(e)
+            if detail is None:
+                raise
+            results.append(detail)
+        cursor.execute('RELEASE booking_item')
+
+    failed = any(not isinstance(result, int) for result in results)
+    if all_or_nothing and failed:
+        conn.rollback()
+    else:
+        events.write_outbox(cursor, [
+            events.slot_change(*slot_names(*item), user_id, first_name, result)
+            for item, result in zip(items, results) if isinstance(result, int)
+        ])
+        conn.commit()
+    return results
+
+def slot_names(day, court_id, slot):
+    # (date, court_type, time_slot) для ответов API и сообщений events
+    catalog = schedule.catalog()
+    return schedule.day_string(day), catalog.court_code(court_id), catalog.slot_name(court_id, slot)
+
+def booking_dict(row):
+    date, court_type, time_slot = slot_names(row['day'], row['court_id'], row['slot'])
+    return {
+        "id": row['id'],
+        "court_type": court_type,
+        "date": date,
+        "time_slot": time_slot
+    }
+
+# Оба запроса идут по индексам bookings_user и bookings_archive_user без сортировки,
+# это проверяет check_query_plans
+USER_BOOKINGS_QUERY = '''
+    SELECT id, court_id, day, slot
+    FROM bookings
+    WHERE user_id = ? AND (day, slot, id) > (?, ?, ?)
+    ORDER BY day, slot, id
+    LIMIT ?
+'''
+USER_HISTORY_QUERY = '''
+    SELECT id, court_id, day, slot
+    FROM bookings
+    WHERE user_id = ? AND (day, slot, id) > (?, ?, ?)
+    UNION ALL
+    SELECT id, court_id, day, slot
+    FROM bookings_archive
+    WHERE user_id = ? AND (day, slot, id) > (?, ?, ?)
+    ORDER BY day, slot, id
+    LIMIT ?
+'''
+
+def fetch_user_bookings(conn, user_id, after, limit, include_past=False):
+    # after - ключ (day, slot, id) последней записи предыдущей страницы. Возвращает записи
+    # и ключ для следующей страницы или None, если это последняя
+    cursor = conn.cursor()
+    if include_past:
+        cursor.execute(USER_HISTORY_QUERY, (user_id, *after, user_id, *after, limit + 1))
+    else:
+        cursor.execute(USER_BOOKINGS_QUERY, (user_id, *after, limit + 1))
+    rows = cursor.fetchall()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]['day'], rows[-1]['slot'], rows[-1]['id'])
+    return [booking_dict(row) for row in rows], next_after
+
+def check_query_plans(conn):
+    # Запросы списка пользователя не должны читать таблицу целиком, сортировать во временном B-дереве
+    # или ходить из индекса в таблицу. Возвращает строки плана с такими шагами; пустой список - все в порядке
+    problems = []
+    for name, query, params in (
+        ('user_bookings', USER_BOOKINGS_QUERY, (0, *FIRST_KEY, 1)),
+        ('user_history', USER_HISTORY_QUERY, (0, *FIRST_KEY, 0, *FIRST_KEY, 1)),
+    ):
+        for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params):
+            detail = row[3]
+            if detail.startswith('SCAN ') or 'TEMP B-TREE' in detail or (
+                    detail.startswith('SEARCH ') and 'COVERING INDEX' not in detail):
+                problems.append(f"{name}: {detail}")
+    return problems
+
+def promote_from_waitlist(cursor, day, court_id, slot):
+    # Внутри транзакции отмены: освободившийся слот сразу записываем на первого в очереди.
+    # Кто уже записан на этот день, выбывает из очереди, и слот уходит следующему
+    while True:
+        head = cursor.execute('''
+            SELECT w.id, w.user_id, u.first_name
+            FROM waitlist w
+            LEFT JOIN users u ON w.user_id = u.user_id
+            WHERE w.day = ? AND w.court_id = ? AND w.slot = ?
+            ORDER BY w.id
+            LIMIT 1
+        ''', (day, court_id, slot)).fetchone()
+        if head is None:
+            return None
+
+        cursor.execute('DELETE FROM waitlist WHERE id = ?', (head['id'],))
+        cursor.execute('SAVEPOINT promote')
+        try:
+            booking_id = insert_booking_row(cursor, head['user_id'], day, court_id, slot)
+        except sqlite3.IntegrityError as e:
+            cursor.execute('ROLLBACK TO promote')
+            cursor.execute('RELEASE promote')
+            if booking_conflict(e) is None:
+                raise
+            continue
+        cursor.execute('RELEASE promote')
+        return {"user_id": head['user_id'], "first_name": head['first_name'], "booking_id": booking_id}
+
+def cancel_row(cursor, booking_id, user_id):
+    # Отмена внутри открытой транзакции: (отмененная запись, кому слот достался из очереди или None)
+    cursor.execute(
+        'SELECT id, court_id, day, slot FROM bookings WHERE id = ? AND user_id = ?',
+        (booking_id, user_id)
+    )
+    booking = cursor.fetchone()
+    if not booking:
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+
+    cursor.execute(
+        'DELETE FROM bookings WHERE id = ? AND user_id = ?',
+        (booking_id, user_id)
+    )
+
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+    analytics.record_bookings(cursor, [(booking['day'], booking['court_id'], booking['slot'], -1, 1)])
+
+    promoted = promote_from_waitlist(cursor, booking['day'], booking['court_id'], booking['slot'])
+    cancelled = booking_dict(booking)
+    events.write_outbox(cursor, events.cancel_changes(cancelled, user_id, promoted))
+    return cancelled, promoted
+
+def delete_booking(conn, booking_id, user_id):
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    result = cancel_row(cursor, booking_id, user_id)
+    conn.commit()
+    return result
+
+def join_waitlist(conn, user_id, first_name, day, court_id, slot):
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute(
+        'INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
+        (user_id, first_name)
+    )
+
+    holder = cursor.execute(
+        'SELECT user_id FROM bookings WHERE day = ? AND court_id = ? AND slot = ?',
+        (day, court_id, slot)
+    ).fetchone()
+    if holder is None:
+        raise HTTPException(status_code=400, detail="Слот свободен, можно записаться")
+    if holder['user_id'] == user_id:
+        raise HTTPException(status_code=400, detail="Вы уже записаны на этот слот")
+
+    size = cursor.execute(
+        'SELECT COUNT(*) FROM waitlist WHERE day = ? AND court_id = ? AND slot = ?',
+        (day, court_id, slot)
+    ).fetchone()[0]
+    if size >= MAX_WAITLIST_SIZE:
+        raise HTTPException(status_code=400, detail="Очередь на этот слот заполнена")
+
+    try:
+        cursor.execute(
+            'INSERT INTO waitlist (day, court_id, slot, user_id) VALUES (?, ?, ?, ?)',
+            (day, court_id, slot, user_id)
+        )
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Вы уже в очереди на этот слот")
+
+    conn.commit()
+    return {"id": cursor.lastrowid, "position": size + 1}
+
+def fetch_user_waitlist(conn, user_id, today):
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT w.id, w.court_id, w.day, w.slot,
+               (SELECT COUNT(*) FROM waitlist q
+                WHERE q.day = w.day AND q.court_id = w.court_id AND q.slot = w.slot AND q.id <= w.id) AS position
+        FROM waitlist w
+        WHERE w.user_id = ? AND w.day >= ?
+        ORDER BY w.day, w.slot
+    ''', (user_id, today))
+    return [{**booking_dict(row), "position": row['position']} for row in cursor.fetchall()]
+
+def leave_waitlist(conn, entry_id, user_id):
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM waitlist WHERE id = ? AND user_id = ?', (entry_id, user_id))
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Запись в очереди не найдена")
+    conn.commit()
+
+def fetch_replica_rows(conn, day_from, day_to):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT b.id, b.user_id, b.day, b.court_id, b.slot, u.first_name
+        FROM bookings b
+        LEFT JOIN users u ON b.user_id = u.user_id
+        WHERE b.day BETWEEN ? AND ?
+    ''', (day_from, day_to))
+    return cursor.fetchall()
+
+def user_bookings_after(today, include_past, after):
+    # Ключ, после которого начинается страница: без include_past не раньше сегодняшнего дня
+    start = FIRST_KEY if include_past else (today, -1, -1)
+    return max(after, start) if after is not None else start
+
+def not_supported():
+    return HTTPException(status_code=501, detail="Недоступно в этом хранилище")
+
+class SQLiteStorage:
+    # Все операции API над записями. Запись и отмена идут через очередь записи
+    # (writer.WriteQueue), при WRITE_QUEUE_SIZE=0 - каждая своей транзакцией
+    def __init__(self, db, queue_size=writer.WRITE_QUEUE_SIZE):
+        self.db = db
+        self.writer = writer.WriteQueue(db, max_size=queue_size) if queue_size > 0 else None
+
+    async def open(self):
+        problems = await self.db.run(check_query_plans)
+        if problems:
+            logger.warning("User bookings queries lost their indexes: %s", problems)
+        if self.writer is not None:
+            await self.writer.start()
+
+    async def close(self):
+        if self.writer is not None:
+            await self.writer.stop()
+
+    def invalidate(self, day):
+        pass
+
+    def invalidate_all(self):
+        pass
+
+    async def day_bookings(self, day):
+        # Записи на день: id, court_id, slot, first_name
+        return await self.db.run(fetch_day_bookings, day)
+
+    async def range_bookings(self, day_from, day_to, court_id=None):
+        # Пары (court_id, day, slot) за период
+        return await self.db.run(fetch_range_bookings, day_from, day_to, court_id)
+
+    async def book(self, user_id, first_name, day, court_id, slot):
+        if self.writer is not None:
+            return await self.writer.submit(book_row, user_id, first_name, day, court_id, slot)
+        return await self.db.run(insert_booking, user_id, first_name, day, court_id, slot)
+
+    async def cancel(self, booking_id, user_id):
+        # (отмененная запись, кому слот достался из очереди или None)
+        if self.writer is not None:
+            return await self.writer.submit(cancel_row, booking_id, user_id)
+        return await self.db.run(delete_booking, booking_id, user_id)
+
+    async def user_bookings(self, user_id, today, include_past=False, after=None, limit=USER_BOOKINGS_LIMIT):
+        # Страница записей пользователя и ключ следующей страницы; без include_past - с сегодняшнего дня
+        after = user_bookings_after(today, include_past, after)
+        return await self.db.run(fetch_user_bookings, user_id, after, limit, include_past)
+
+    async def occupancy(self, month_from, month_to):
+        # Строки сводки (month, court_id, weekday, slot, bookings, cancellations)
+        return await self.db.run(analytics.fetch_stats, month_from, month_to)
+
+    async def book_batch(self, user_id, first_name, items, all_or_nothing):
+        # По каждому из items: id записи, текст конфликта или None, см. insert_booking_batch
+        return await self.db.run(insert_booking_batch, user_id, first_name, items, all_or_nothing)
+
+    async def import_bookings(self, items, all_or_nothing):
+        return await self.db.run(bulk.import_bookings, items, all_or_nothing)
+
+    def export_chunks(self, day_from, day_to):
+        # Асинхронный генератор порций строк выгрузки
+        return bulk.export_chunks(self.db, day_from, day_to)
+
+    async def join_waitlist(self, user_id, first_name, day, court_id, slot):
+        return await self.db.run(join_waitlist, user_id, first_name, day, court_id, slot)
+
+    async def user_waitlist(self, user_id, today):
+        return await self.db.run(fetch_user_waitlist, user_id, today)
+
+    async def leave_waitlist(self, entry_id, user_id):
+        await self.db.run(leave_waitlist, entry_id, user_id)
+
+class MemoryStorage:
+    # Записи в словарях процесса с индексами по слоту, дню, пользователю и id.
+    # Ограничения те же, что у таблицы bookings, и ошибки те же. Пакетной записи, импорта, выгрузки
+    # и очереди на слот нет (501): без них отмена и не переводит слот следующему в очереди
+    def __init__(self):
+        self._slots = {}
+        self._days = {}
+        self._user_days = {}
+        self._ids = {}
+        self._users = {}
+        self._last_id = 0
+        self._stats = {}
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def invalidate(self, day):
+        pass
+
+    def invalidate_all(self):
+        pass
+
+    def put(self, booking):
+        key = (booking['day'], booking['court_id'], booking['slot'])
+        self._slots[key] = booking
+        self._days.setdefault(booking['day'], set()).add(key)
+        self._user_days.setdefault(booking['user_id'], {})[booking['day']] = key
+        self._ids[booking['id']] = key
+        self._last_id = max(self._last_id, booking['id'])
+
+    def remove(self, key):
+        booking = self._slots.pop(key)
+        self._days[booking['day']].discard(key)
+        if not self._days[booking['day']]:
+            del self._days[booking['day']]
+        user_days = self._user_days[booking['user_id']]
+        del user_days[booking['day']]
+        if not user_days:
+            del self._user_days[booking['user_id']]
+        del self._ids[booking['id']]
+        return booking
+
+    def record(self, booking, booked, cancelled):
+        # Сводка меняется только при записи и отмене через API, не при загрузке дней
+        key = analytics.stats_key(booking['day'], booking['court_id'], booking['slot'])
+        bookings, cancellations = self._stats.get(key, (0, 0))
+        self._stats[key] = (bookings + booked, cancellations + cancelled)
+
+    def replace_days(self, day_from, day_to, rows):
+        # Заменяет содержимое дней day_from..day_to строками fetch_replica_rows
+        for day in range(day_from, day_to + 1):
+            for key in list(self._days.get(day, ())):
+                self.remove(key)
+        for row in rows:
+            if row['first_name'] is not None:
+                self._users[row['user_id']] = row['first_name']
+            self.put({key: row[key] for key in ('id', 'user_id', 'day', 'court_id', 'slot')})
+
+    async def day_bookings(self, day):
+        return [
+            {"id": booking['id'], "court_id": booking['court_id'], "slot": booking['slot'],
+             "first_name": self._users.get(booking['user_id'])}
+            for booking in map(self._slots.get, self._days.get(day, ()))
+        ]
+
+    async def range_bookings(self, day_from, day_to, court_id=None):
+        rows = []
+        for day in range(day_from, day_to + 1):
+            for key in self._days.get(day, ()):
+                if not court_id or key[1] == court_id:
+                    rows.append((key[1], day, key[2]))
+        return rows
+
+    async def book(self, user_id, first_name, day, court_id, slot):
+        self._users.setdefault(user_id, first_name)
+        if (day, court_id, slot) in self._slots:
+            raise HTTPException(status_code=400, detail=BOOKING_CONFLICTS['bookings.day, bookings.court_id, bookings.slot'])
+        if day in self._user_days.get(user_id, ()):
+            raise HTTPException(status_code=400, detail=BOOKING_CONFLICTS['bookings.user_id, bookings.day'])
+        booking_id = self._last_id + 1
+        booking = {"id": booking_id, "user_id": user_id, "day": day, "court_id": court_id, "slot": slot}
+        self.put(booking)
+        self.record(booking, 1, 0)
+        return booking_id
+
+    async def cancel(self, booking_id, user_id):
+        key = self._ids.get(booking_id)
+        if key is None or self._slots[key]['user_id'] != user_id:
+            raise HTTPException(status_code=404, detail="Запись не найдена")
+        booking = self.remove(key)
+        self.record(booking, -1, 1)
+        return booking_dict(booking), None
+
+    async def user_bookings(self, user_id, today, include_past=False, after=None, limit=USER_BOOKINGS_LIMIT):
+        after = user_bookings_after(today, include_past, after)
+        bookings = sorted(
+            (booking for booking in map(self._slots.get, self._user_days.get(user_id, {}).values())
+             if (booking['day'], booking['slot'], booking['id']) > after),
+            key=lambda booking: (booking['day'], booking['slot'], booking['id'])
+        )
+        next_after = None
+        if len(bookings) > limit:
+            bookings = bookings[:limit]
+            next_after = (bookings[-1]['day'], bookings[-1]['slot'], bookings[-1]['id'])
+        return [booking_dict(booking) for booking in bookings], next_after
+
+    async def occupancy(self, month_from, month_to):
+        return [
+            (*key, bookings, cancellations)
+            for key, (bookings, cancellations) in self._stats.items()
+            if month_from <= key[0] <= month_to
+        ]
+
+    async def book_batch(self, user_id, first_name, items, all_or_nothing):
+        raise not_supported()
+
+    async def import_bookings(self, items, all_or_nothing):
+        raise not_supported()
+
+    def export_chunks(self, day_from, day_to):
+        raise not_supported()
+
+    async def join_waitlist(self, user_id, first_name, day, court_id, slot):
+        raise not_supported()
+
+    async def user_waitlist(self, user_id, today):
+        return []
+
+    async def leave_waitlist(self, entry_id, user_id):
+        raise HTTPException(status_code=404, detail="Запись в очереди не найдена")
+
+class ReplicaStorage(SQLiteStorage):
+    # Запись и списки пользователя - в SQLite, записи по дням - из копии в памяти.
+    # Изменения (свои, других воркеров, импорт, архив) приходят через hub и помечают день
+    # устаревшим; такой день перечитывается из базы одним запросом при следующем чтении
+    def __init__(self, db, warm_days=REPLICA_WARM_DAYS):
+        super().__init__(db)
+        self.warm_days = warm_days
+        self.replica = MemoryStorage()
+        self.generation = 0
+        self._fresh = set()
+
+    async def open(self):
+        await super().open()
+        today = schedule.today_number()
+        await self._load(today, today + self.warm_days - 1)
+
+    def invalidate(self, day):
+        self.generation += 1
+        self._fresh.discard(day)
+
+    def invalidate_all(self):
+        self.generation += 1
+        self._fresh.clear()
+
+    async def _load(self, day_from, day_to):
+        # Возвращает хранилище в памяти, из которого отвечать на запрос
+        generation = self.generation
+        rows = await self.db.run(fetch_replica_rows, day_from, day_to)
+        if generation != self.generation:
+            # Пока читали, была запись: копию за это время могла обновить более поздняя загрузка,
+            # и эти строки ее бы затерли. Копию не трогаем, на запрос отвечаем прочитанным
+            snapshot = MemoryStorage()
+            snapshot.replace_days(day_from, day_to, rows)
+            return snapshot
+        self.replica.replace_days(day_from, day_to, rows)
+        self._fresh.update(range(day_from, day_to + 1))
+        return self.replica
+
+    async def day_bookings(self, day):
+        source = self.replica if day in self._fresh else await self._load(day, day)
+        return await source.day_bookings(day)
+
+    async def range_bookings(self, day_from, day_to, court_id=None):
+        source = self.replica
+        if not self._fresh.issuperset(range(day_from, day_to + 1)):
+            source = await self._load(day_from, day_to)
+        return await source.range_bookings(day_from, day_to, court_id)
+
+def make_storage(name, db):
+    if name == 'sqlite':
+        return SQLiteStorage(db)
+    if name == 'replica':
+        return ReplicaStorage(db)
+    if name == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage {name}")
+
+# Создается в lifespan приложения
+backend = None
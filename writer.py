@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from fastapi import HTTPException
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Очередь записи: запросы на запись и отмену собираются в пачки и выполняются одной транзакцией,
+# так что в процессе всегда один писатель и всплеск на открытии записи не упирается в блокировку SQLite.
+# Очередь ограничена: когда она полна, запрос сразу получает 503 с Retry-After
+WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', '500'))
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '100'))
+# Сколько писатель ждет после первой заявки, чтобы собрать пачку, секунды
+WRITE_BATCH_WINDOW = float(os.getenv('WRITE_BATCH_WINDOW', '0.002'))
+WRITE_RETRY_AFTER = 1
+
+def overloaded():
+    return HTTPException(
+        status_code=503,
+        detail="Сервер перегружен, повторите попытку",
+        headers={"Retry-After": str(WRITE_RETRY_AFTER)}
+    )
+
+def apply_batch(conn, ops):
+    # ops: (func, args), func(cursor, *args) работает внутри транзакции. Каждая операция под своим
+    # SAVEPOINT: любое ее исключение откатывает только ее и становится результатом этой операции,
+    # остальные заявки пачки сохраняются
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    results = []
+    for func, args in ops:
+        cursor.execute('SAVEPOINT write_item')
+        try:
+            results.append(func(cursor, *args))
+        except HTTPException as e:
+            cursor.execute('ROLLBACK TO write_item')
+            database.release_cursors(e)
+            results.append(HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers))
+        except Exception as e:
+            # Непредвиденная ошибка (например, IntegrityError не из BOOKING_CONFLICTS) - 500 только этой заявке
+            cursor.execute('ROLLBACK TO write_item')
+            database.release_cursors(e)
+            results.append(e)
+        cursor.execute('RELEASE write_item')
+    conn.commit()
+    return results
+
+class WriteQueue:
+    def __init__(self, db, max_size=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE, window=WRITE_BATCH_WINDOW):
+        self.db = db
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.window = window
+        self.submitted = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.accepting = False
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run())
+        self.accepting = True
+
+    async def stop(self):
+        # Уже принятые заявки дописываются до остановки. Новые перестаем принимать до маркера остановки:
+        # заявка, вставшая в очередь после него, никогда не получила бы ответ
+        if self._task is None:
+            return
+        self.accepting = False
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, func, *args):
+        if not self.accepting or self._queue.full():
+            self.rejected += 1
+            raise overloaded()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((func, args, future))
+        self.submitted += 1
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            batch = [item]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch):
+        self.batches += 1
+        self.written += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = await self.db.run(apply_batch, [(func, args) for func, args, _ in batch])
+        except sqlite3.OperationalError as e:
+            # База занята другим процессом дольше busy_timeout - клиенту лучше повторить, чем получить 500
+            logger.warning("Write batch of %s failed: %s", len(batch), e)
+            results = [overloaded() for _ in batch]
+        except Exception as e:
+            logger.exception("Write batch of %s failed", len(batch))
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            # Клиент мог отключиться, не дождавшись ответа
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "largest_batch": self.largest_batch,
+            "average_batch": round(self.written / self.batches, 2) if self.batches else 0.0
+        }